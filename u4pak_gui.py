@@ -28,14 +28,22 @@ import math
 import argparse
 import traceback
 import mmap
-import weakref
 import stat
-
-from struct import unpack as st_unpack, pack as st_pack
-from collections import OrderedDict
+import queue
+import time
+import atexit
+import threading
+
+from struct import Struct, error as struct_error
+from array import array
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from io import DEFAULT_BUFFER_SIZE
 from binascii import hexlify
-from typing import NamedTuple, Optional, Tuple, List, Dict, Set, Iterable, Iterator, Callable, IO, Any, Union
+from bisect import bisect_left, bisect_right
+from collections import deque, OrderedDict
+from itertools import chain
+from typing import NamedTuple, Optional, Tuple, List, Dict, Set, Iterable, Iterator, Callable, IO, Any, Union, Sequence
 
 # --- Integrasi PySide6 ---
 from PySide6.QtWidgets import (
@@ -44,8 +52,8 @@ from PySide6.QtWidgets import (
     QTreeView, QProgressBar, QLabel, QCheckBox, QComboBox, QListWidget,
     QMessageBox, QHeaderView, QListWidgetItem
 )
-from PySide6.QtGui import QStandardItemModel, QStandardItem, QFont
-from PySide6.QtCore import QObject, QThread, Signal, Qt
+from PySide6.QtGui import QFont
+from PySide6.QtCore import QObject, QThread, Signal, Slot, Qt, QAbstractItemModel, QModelIndex
 
 try:
 	import llfuse # type: ignore
@@ -56,29 +64,96 @@ else:
 
 HAS_STAT_NS = hasattr(os.stat_result, 'st_atime_ns')
 
+# SHA-1 is only used as a checksum here, so tell OpenSSL it isn't used for
+# security and it can pick its fastest implementation (SHA-NI where the CPU
+# has it) without going through FIPS checks. usedforsecurity needs Python 3.9.
+try:
+	hashlib.sha1(usedforsecurity=False)
+except TypeError:
+	def new_sha1() -> Any:
+		return hashlib.sha1()
+else:
+	def new_sha1() -> Any:
+		return hashlib.sha1(usedforsecurity=False)
+
 # ==============================================================================
 # == KODE INTI DARI u4pak.py (sedikit dimodifikasi untuk integrasi GUI) ==
 # ==============================================================================
 
 __all__ = 'read_index', 'pack'
 
+# buffer size of archive streams, for everything that isn't read through a
+# memory mapping the default of 8 KiB means far too many syscalls
+STREAM_BUFFER_SIZE = 4 << 20
+
+# Copy buffers are recycled instead of allocated per extracted file, which
+# matters for archives with tens of thousands of small entries.
+POOL_BUFFER_SIZE = 1 << 20
+_buffer_pool: queue.LifoQueue[bytearray] = queue.LifoQueue()
+
+@contextmanager
+def pooled_buffer() -> Iterator[bytearray]:
+	try:
+		buf = _buffer_pool.get_nowait()
+	except queue.Empty:
+		buf = bytearray(POOL_BUFFER_SIZE)
+	try:
+		yield buf
+	finally:
+		_buffer_pool.put_nowait(buf)
+
 def highlevel_sendfile(outfile: io.BufferedWriter, infile: io.BufferedReader, offset: int, size: int) -> None:
 	infile.seek(offset,0)
-	buf_size = DEFAULT_BUFFER_SIZE
-	buf = bytearray(buf_size)
+	with pooled_buffer() as buf:
+		buf_size = len(buf)
+		while size > 0:
+			if size >= buf_size:
+				n = infile.readinto(buf) or 0
+				if n < buf_size:
+					raise IOError("unexpected end of file")
+				outfile.write(buf)
+				size -= buf_size
+			else:
+				data = infile.read(size) or b''
+				if len(data) < size:
+					raise IOError("unexpected end of file")
+				outfile.write(data)
+				size = 0
+
+HAS_COPY_FILE_RANGE = hasattr(os, 'copy_file_range')
+
+def copy_file_range(out_fd: int, in_fd: int, offset: int, size: int) -> int:
+	"""
+	Copy as much as the kernel is willing to via copy_file_range(2), which
+	stays entirely in kernel space and can even share extents (reflinks).
+	Returns the number of bytes copied, which is less than size if the
+	kernel or filesystem doesn't support it (e.g. across filesystems on
+	older kernels). The rest is then left to the caller.
+	"""
+	copied = 0
+	while copied < size:
+		try:
+			count = os.copy_file_range(in_fd, out_fd, size - copied, offset + copied)
+		except OSError:
+			break
+		if count == 0:
+			break
+		copied += count
+	return copied
+
+# Linux transfers at most 0x7ffff000 bytes per sendfile() call
+SENDFILE_MAX_SIZE = 0x7ffff000
+
+HAS_SPLICE = hasattr(os, 'splice')
+
+def splice(out_fd: int, in_fd: int, offset: int, size: int) -> None:
+	# move file pages into a pipe via splice(2), no copy through user space
 	while size > 0:
-		if size >= buf_size:
-			n = infile.readinto(buf) or 0
-			if n < buf_size:
-				raise IOError("unexpected end of file")
-			outfile.write(buf)
-			size -= buf_size
-		else:
-			data = infile.read(size) or b''
-			if len(data) < size:
-				raise IOError("unexpected end of file")
-			outfile.write(data)
-			size = 0
+		count = os.splice(in_fd, out_fd, min(size, SENDFILE_MAX_SIZE), offset_src=offset)
+		if count == 0:
+			raise IOError("unexpected end of file")
+		offset += count
+		size   -= count
 
 if hasattr(os, 'sendfile'):
 	def os_sendfile(outfile: io.BufferedWriter, infile: io.BufferedReader, offset: int, size: int) -> None:
@@ -88,13 +163,156 @@ if hasattr(os, 'sendfile'):
 		except:
 			highlevel_sendfile(outfile, infile, offset, size)
 		else:
-			# size == 0 has special meaning for some sendfile implentations
-			if size > 0:
-				os.sendfile(out_fd, in_fd, offset, size)
+			if HAS_SPLICE and stat.S_ISFIFO(os.fstat(out_fd).st_mode):
+				# copy_file_range() only works between files
+				splice(out_fd, in_fd, offset, size)
+				return
+
+			if HAS_COPY_FILE_RANGE:
+				copied = copy_file_range(out_fd, in_fd, offset, size)
+				offset += copied
+				size   -= copied
+
+			# size == 0 has special meaning for some sendfile implentations,
+			# and sendfile() may copy less than asked for, so loop
+			while size > 0:
+				count = os.sendfile(out_fd, in_fd, offset, min(size, SENDFILE_MAX_SIZE))
+				if count == 0:
+					raise IOError("unexpected end of file")
+				offset += count
+				size   -= count
 	sendfile = os_sendfile
 else:
 	sendfile = highlevel_sendfile
 
+MADV_SEQUENTIAL: Optional[int] = getattr(mmap, 'MADV_SEQUENTIAL', None)
+MADV_RANDOM:     Optional[int] = getattr(mmap, 'MADV_RANDOM', None)
+MADV_WILLNEED:   Optional[int] = getattr(mmap, 'MADV_WILLNEED', None)
+
+POSIX_FADV_SEQUENTIAL: Optional[int] = getattr(os, 'POSIX_FADV_SEQUENTIAL', None)
+POSIX_FADV_WILLNEED:   Optional[int] = getattr(os, 'POSIX_FADV_WILLNEED', None)
+POSIX_FADV_DONTNEED:   Optional[int] = getattr(os, 'POSIX_FADV_DONTNEED', None)
+
+# unpacking less than this fraction of an archive counts as selective
+SELECTIVE_UNPACK_RATIO = 0.2
+
+# check_integrity reports progress after roughly this many bytes were hashed
+CHECK_PROGRESS_INTERVAL = 64 << 20
+
+# zlib records inflating to at least this many bytes are unpacked straight
+# into a mapping of the preallocated output file
+MAP_OUTPUT_SIZE = 1 << 20
+
+HAS_POSIX_FALLOCATE = hasattr(os, 'posix_fallocate')
+
+def madvise(data: mmap.mmap, advice: Optional[int], offset: int = 0, size: Optional[int] = None) -> None:
+	# access pattern hints are optional, not every platform has them
+	if advice is None:
+		return
+	try:
+		if size is None:
+			data.madvise(advice, offset)
+		else:
+			data.madvise(advice, offset, size)
+	except (AttributeError, OSError, ValueError):
+		pass
+
+def fadvise(stream: IO[bytes], advice: Optional[int], offset: int = 0, size: int = 0) -> None:
+	# same as madvise(), but for archives that are read without a mapping
+	if advice is None:
+		return
+	try:
+		os.posix_fadvise(stream.fileno(), offset, size, advice)
+	except (AttributeError, io.UnsupportedOperation, OSError, ValueError):
+		pass
+
+def map_archive(stream: IO[bytes], advice: Optional[int] = MADV_SEQUENTIAL) -> Optional[mmap.mmap]:
+	"""
+	Map the whole archive read-only. Returns None if the stream can't be
+	mapped (e.g. it's not backed by a regular file), callers then fall back
+	to plain reads.
+	"""
+	try:
+		data = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+	except (AttributeError, io.UnsupportedOperation, OSError, ValueError):
+		return None
+	madvise(data, advice)
+	return data
+
+def advise_unpack(data: mmap.mmap, records: List[Record]) -> None:
+	"""
+	Pick the access pattern hint for extracting the given records. Readahead
+	is a win when most of the archive is unpacked, but for a few files out
+	of a big archive it mostly fetches pages that are never used, so then
+	only the ranges of the selected records are prefetched.
+	"""
+	selected = 0
+	for record in records:
+		selected += record.alloc_size
+
+	if selected >= len(data) * SELECTIVE_UNPACK_RATIO:
+		madvise(data, MADV_SEQUENTIAL)
+		return
+
+	madvise(data, MADV_RANDOM)
+	for record in sorted(records, key=lambda record: record.offset):
+		prefetch_record(data, record)
+
+def prefetch_record(data: mmap.mmap, record: Record) -> None:
+	# madvise() wants a page aligned start
+	start = record.offset - record.offset % mmap.PAGESIZE
+	madvise(data, MADV_WILLNEED, start, record.data_offset + record.compressed_size - start)
+
+# records asked for ahead of the one that is unpacked without a mapping
+PREFETCH_RECORDS = 3
+
+def prefetch_stream_records(stream: IO[bytes], records: Iterable[Record]) -> None:
+	# same as prefetch_record(), but for archives that are read without a mapping
+	for record in records:
+		fadvise(stream, POSIX_FADV_WILLNEED, record.offset, record.alloc_size)
+
+def sha1_file(path: str) -> bytes:
+	hasher = new_sha1()
+	with open(path, "rb") as fp:
+		# hash the whole file in one update() call through a mapping
+		if os.fstat(fp.fileno()).st_size > 0:
+			with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+				hasher.update(data)
+	return hasher.digest()
+
+def read_blocks(stream: io.BufferedReader, base_offset: int, blocks: Sequence[Tuple[int, int]], max_size: int = POOL_BUFFER_SIZE) -> Iterator[memoryview]:
+	"""
+	Yield the data of each (start, end) block. Blocks that are stored back to
+	back, which is normally all of them, are fetched with a single read() of
+	up to max_size bytes instead of a seek() and read() per block. The runs
+	are read into a pooled buffer, so a yielded block is only valid until the
+	next one is requested.
+	"""
+	index = 0
+	block_count = len(blocks)
+	with pooled_buffer() as buf, memoryview(buf) as buf_view:
+		while index < block_count:
+			run_start, run_end = blocks[index]
+			run_stop = index + 1
+			while run_stop < block_count:
+				start_offset, end_offset = blocks[run_stop]
+				if start_offset != run_end or end_offset - run_start > max_size:
+					break
+				run_end = end_offset
+				run_stop += 1
+
+			stream.seek(base_offset + run_start, 0)
+			run_size = run_end - run_start
+			if run_size <= len(buf):
+				# a single block bigger than the buffer is read on its own below
+				run = buf_view[:stream.readinto(buf_view[:run_size]) or 0]
+			else:
+				run = memoryview(stream.read(run_size) or b'')
+			with run:
+				for start_offset, end_offset in blocks[index:run_stop]:
+					yield run[start_offset - run_start:end_offset - run_start]
+			index = run_stop
+
 def raise_check_error(ctx: Optional[Record], message: str) -> None:
 	if ctx is None:
 		raise ValueError(message)
@@ -115,8 +333,7 @@ class FragInfo(object):
 		self.__size  = size
 		self.__frags = []
 		if frags:
-			for start, end in frags:
-				self.add(start, end)
+			self.add_all(frags)
 
 	@property
 	def size(self) -> int:
@@ -139,38 +356,63 @@ class FragInfo(object):
 			raise IndexError("range out of bounds: (%r, %r]" % (new_start, new_end))
 
 		frags = self.__frags
-		for i, (start, end) in enumerate(frags):
-			if new_end < start:
-				frags.insert(i, (new_start, new_end))
-				return
+		# frags is sorted and non-overlapping, so binary search for the first
+		# fragment starting at or after new_start ((x,) sorts before any (x, y))
+		i = bisect_left(frags, (new_start,))
+		if i > 0 and frags[i - 1][1] >= new_start:
+			# starts inside (or right at the end of) the previous fragment
+			i -= 1
+			new_start = frags[i][0]
+
+		# swallow all fragments that start inside the new one
+		j = i
+		n = len(frags)
+		while j < n:
+			next_start, next_end = frags[j]
+			if next_start > new_end:
+				break
+			if next_end > new_end:
+				new_end = next_end
+			j += 1
+
+		frags[i:j] = [(new_start, new_end)]
+
+	def add_all(self, ranges: Iterable[Tuple[int, int]]) -> None:
+		"""
+		Same as calling add() for every range, but with one sort and one merge
+		pass over everything instead of an insertion per range.
+		"""
+		size = self.__size
+		new_frags: List[Tuple[int, int]] = []
+		append = new_frags.append
+		for new_start, new_end in ranges:
+			if new_start >= new_end:
+				continue
 
-			elif new_start <= start:
-				if new_end <= end:
-					frags[i] = (new_start, end)
-					return
+			elif new_start >= size or new_end > size:
+				raise IndexError("range out of bounds: (%r, %r]" % (new_start, new_end))
 
-			elif new_start <= end:
-				if new_end > end:
-					new_start = start
-			else:
-				continue
+			append((new_start, new_end))
 
-			j = i+1
-			n = len(frags)
-			while j < n:
-				next_start, next_end = frags[j]
-				if next_start <= new_end:
-					j += 1
-					if next_end > new_end:
-						new_end = next_end
-						break
-				else:
-					break
+		new_frags.extend(self.__frags)
+		new_frags.sort()
 
-			frags[i:j] = [(new_start, new_end)]
-			return
+		frags: List[Tuple[int, int]] = []
+		append = frags.append
+		prev_start = prev_end = -1
+		for start, end in new_frags:
+			if start <= prev_end:
+				if end > prev_end:
+					prev_end = end
+				continue
+			if prev_end >= 0:
+				append((prev_start, prev_end))
+			prev_start, prev_end = start, end
+
+		if prev_end >= 0:
+			append((prev_start, prev_end))
 
-		frags.append((new_start, new_end))
+		self.__frags = frags
 
 	def invert(self) -> FragInfo:
 		inverted = FragInfo(self.__size)
@@ -200,7 +442,7 @@ class FragInfo(object):
 		return free
 
 class Pak(object):
-	__slots__ = ('version', 'index_offset', 'index_size', 'footer_offset', 'index_sha1', 'mount_point', 'records')
+	__slots__ = ('version', 'index_offset', 'index_size', 'footer_offset', 'index_sha1', 'mount_point', 'records', '_read_record', '_unpack_record', '_index')
 
 	version: int
 	index_offset: int
@@ -218,6 +460,10 @@ class Pak(object):
 		self.index_sha1    = index_sha1
 		self.mount_point   = mount_point
 		self.records       = records or []
+		# record parsers of this version, None if it is not supported
+		self._read_record   = _READ_RECORD.get(version)
+		self._unpack_record = _UNPACK_RECORD.get(version)
+		self._index: Optional[PakIndex] = None
 
 	def __len__(self) -> int:
 		return len(self.records)
@@ -229,48 +475,57 @@ class Pak(object):
 		return 'Pak(version=%r, index_offset=%r, index_size=%r, footer_offset=%r, index_sha1=%r, mount_point=%r, records=%r)' % (
 			self.version, self.index_offset, self.index_size, self.footer_offset, self.index_sha1, self.mount_point, self.records)
 
-	def check_integrity(self, stream: io.BufferedReader, callback: Callable[[Optional[Record], str], None] = raise_check_error, ignore_null_checksums: bool = False) -> None:
-		index_offset = self.index_offset
-		buf = bytearray(DEFAULT_BUFFER_SIZE)
-
-		read_record: Callable[[io.BufferedReader, str], Record]
-		if self.version == 1:
-			read_record = read_record_v1
-
-		elif self.version == 2:
-			read_record = read_record_v2
-
-		elif self.version == 3:
-			read_record = read_record_v3
-
-		elif self.version == 4:
-			read_record = read_record_v4
+	def check_integrity(self, stream: io.BufferedReader, callback: Callable[[Optional[Record], str], None] = raise_check_error, ignore_null_checksums: bool = False,
+	                    progress: Optional[Callable[[int, int], None]] = None) -> None:
+		"""
+		Check the index and all records of the archive. callback and progress
+		are only called from the calling thread, and callback gets the errors
+		in archive order even though the records may be checked in parallel.
+		"""
+		data = map_archive(stream)
+		if data is None:
+			fadvise(stream, POSIX_FADV_SEQUENTIAL)
+		try:
+			self._check_integrity(stream, data, callback, ignore_null_checksums, progress)
+		finally:
+			if data is not None:
+				data.close()
 
-		elif self.version == 7:
-			read_record = read_record_v7
+	def _check_integrity(self, stream: io.BufferedReader, data: Optional[mmap.mmap], callback: Callable[[Optional[Record], str], None], ignore_null_checksums: bool,
+	                     progress: Optional[Callable[[int, int], None]]) -> None:
+		index_offset = self.index_offset
+		# only needed when the archive couldn't be mapped
+		buf = bytearray(STREAM_BUFFER_SIZE if data is None else 0)
 
-		else:
+		read_record   = self._read_record
+		unpack_record = self._unpack_record
+		if read_record is None or unpack_record is None:
 			raise ValueError(f'unsupported version: {self.version}')
 
-		def check_data(ctx, offset, size, sha1):
+		def check_data(report, ctx, offset, size, sha1):
 			if ignore_null_checksums and sha1 == b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00':
 				return
 
-			hasher = hashlib.sha1()
-			stream.seek(offset, 0)
-
-			while size > 0:
-				if size >= DEFAULT_BUFFER_SIZE:
-					size -= stream.readinto(buf)
-					hasher.update(buf)
-				else:
-					rest = stream.read(size)
-					assert rest is not None
-					hasher.update(rest)
-					size = 0
+			hasher = new_sha1()
+			if data is not None:
+				# hash the whole range in one call, OpenSSL does the rest without the GIL
+				with memoryview(data) as view:
+					hasher.update(view[offset:offset + size])
+			else:
+				stream.seek(offset, 0)
+
+				while size > 0:
+					if size >= len(buf):
+						size -= stream.readinto(buf)
+						hasher.update(buf)
+					else:
+						rest = stream.read(size)
+						assert rest is not None
+						hasher.update(rest)
+						size = 0
 
 			if hasher.digest() != sha1:
-				callback(ctx,
+				report(ctx,
 						 'checksum missmatch:\n'
 						 '\tgot:      %s\n'
 						 '\texpected: %s' % (
@@ -278,68 +533,188 @@ class Pak(object):
 							 hexlify(sha1).decode('latin1')))
 
 		# test index sha1 sum
-		check_data("<archive index>", index_offset, self.index_size, self.index_sha1)
-
-		for r1 in self:
-			stream.seek(r1.offset, 0)
-			r2 = read_record(stream, r1.filename)
+		check_data(callback, "<archive index>", index_offset, self.index_size, self.index_sha1)
+
+		# progress is counted in bytes of data and only reported every
+		# CHECK_PROGRESS_INTERVAL bytes, not for every (often tiny) record
+		total_size = self.index_size + sum(r1.compressed_size for r1 in self)
+		checked_size = self.index_size
+		next_report = checked_size + CHECK_PROGRESS_INTERVAL
+
+		def check_record(r1: Record, report: Callable[[Optional[Record], str], None]) -> None:
+			if data is not None:
+				# the data record header is parsed from the mapping, no seek() + read()
+				r2, _ = unpack_record(data, r1.offset, r1.filename)
+			else:
+				# fetch the header with one read() sized after the index entry; only
+				# if the stored one doesn't fit in that (e.g. it lists more blocks)
+				# parse it field by field
+				stream.seek(r1.offset, 0)
+				try:
+					r2, _ = unpack_record(stream.read(r1.header_size), 0, r1.filename)
+				except (struct_error, ValueError):
+					stream.seek(r1.offset, 0)
+					r2 = read_record(stream, r1.filename)
 
 			# test index metadata
 			if r2.offset != 0:
-				callback(r2, 'data record offset field is not 0 but %d' % r2.offset)
+				report(r2, 'data record offset field is not 0 but %d' % r2.offset)
 
 			if not same_metadata(r1, r2):
-				callback(r1, 'metadata missmatch:\n%s' % metadata_diff(r1, r2))
+				report(r1, 'metadata missmatch:\n%s' % metadata_diff(r1, r2))
 
 			if r1.compression_method not in COMPR_METHODS:
-				callback(r1, 'unknown compression method: 0x%02x' % r1.compression_method)
+				report(r1, 'unknown compression method: 0x%02x' % r1.compression_method)
 
 			if r1.compression_method == COMPR_NONE and r1.compressed_size != r1.uncompressed_size:
-				callback(r1, 'file is not compressed but compressed size (%d) differes from uncompressed size (%d)' %
+				report(r1, 'file is not compressed but compressed size (%d) differes from uncompressed size (%d)' %
 						 (r1.compressed_size, r1.uncompressed_size))
 
 			if r1.data_offset + r1.compressed_size > index_offset:
-				callback(None, 'data bleeds into index')
+				report(None, 'data bleeds into index')
 
 			# test file sha1 sum
 			if ignore_null_checksums and r1.sha1 == b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00':
 				pass
 			elif r1.compression_blocks is None:
-				check_data(r1, r1.data_offset, r1.compressed_size, r1.sha1)
+				check_data(report, r1, r1.data_offset, r1.compressed_size, r1.sha1)
 			else:
-				hasher = hashlib.sha1()
+				hasher = new_sha1()
 				base_offset = r1.base_offset
-				for start_offset, end_offset in r1.compression_blocks:
-					block_size = end_offset - start_offset
-					stream.seek(base_offset + start_offset, 0)
-					data = stream.read(block_size)
-					hasher.update(data)
+				if data is not None:
+					# Blocks are normally stored back to back, so feed each run of
+					# contiguous blocks to the hasher as one window instead of
+					# entering it once per (often small) block.
+					with memoryview(data) as view:
+						run_start = run_end = 0
+						for start_offset, end_offset in r1.compression_blocks:
+							if start_offset != run_end:
+								hasher.update(view[base_offset + run_start:base_offset + run_end])
+								run_start = start_offset
+							run_end = end_offset
+						hasher.update(view[base_offset + run_start:base_offset + run_end])
+				else:
+					for block_data in read_blocks(stream, base_offset, r1.compression_blocks):
+						hasher.update(block_data)
 				
 				if hasher.digest() != r1.sha1:
-					callback(r1,
+					report(r1,
 							'checksum missmatch:\n'
 							'\tgot:      %s\n'
 							'\texpected: %s' % (
 								hasher.hexdigest(),
 								hexlify(r1.sha1).decode('latin1')))
 
-	def unpack(self, stream: io.BufferedReader, outdir: str=".", callback: Callable[[str], None] = lambda name: None) -> None:
-		for record in self:
-			record.unpack(stream, outdir, callback)
+		# visit records in archive order so the data is read sequentially
+		batches = batch_records(sorted(self.records, key=lambda record: record.offset))
+
+		# Errors are collected per batch and passed to callback from this
+		# thread in archive order, no matter where and in which order the
+		# batches are checked. Every batch only appends to its own list.
+		batch_errors: Dict[int, List[Tuple[Optional[Record], str]]] = {id(batch): [] for batch in batches}
+
+		def check_batch(batch: List[Record]) -> List[Record]:
+			errors = batch_errors[id(batch)]
+			report = lambda ctx, message: errors.append((ctx, message))
+			for r1 in batch:
+				check_record(r1, report)
+			if data is None:
+				# every byte is hashed only once, don't let it crowd the page cache
+				start = batch[0].offset
+				last  = batch[-1]
+				fadvise(stream, POSIX_FADV_DONTNEED, start, last.data_offset + last.compressed_size - start)
+			return batch
+
+		if data is not None:
+			# Records are only read from the mapping and hashlib releases the
+			# GIL while hashing, so check them in parallel.
+			checked_batches = map_batches(check_batch, batches)
+		else:
+			# without a mapping all records share the seek position of stream
+			checked_batches = (check_batch(batch) for batch in batches)
 
-	def unpack_only(self, stream: io.BufferedReader, files: Iterable[str], outdir: str = ".", callback: Callable[[str], None] = lambda name: None) -> None:
-		for record in self:
-			if shall_unpack(files, record.filename):
-				record.unpack(stream, outdir, callback)
+		checked: Set[int] = set()
+		next_batch = 0
+		try:
+			for batch in checked_batches:
+				checked.add(id(batch))
+				while next_batch < len(batches) and id(batches[next_batch]) in checked:
+					for ctx, message in batch_errors.pop(id(batches[next_batch])):
+						callback(ctx, message)
+					next_batch += 1
+
+				for r1 in batch:
+					checked_size += r1.compressed_size
+				if progress is not None and checked_size >= next_report:
+					progress(checked_size, total_size)
+					next_report = checked_size + CHECK_PROGRESS_INTERVAL
+		finally:
+			# if callback raised, wait for the running batches before the
+			# mapping they read from is closed
+			checked_batches.close()
+
+		if progress is not None:
+			progress(total_size, total_size)
+
+	def unpack(self, stream: io.BufferedReader, outdir: str=".", callback: Callable[[str], None] = lambda name: None, skip_unpacked: bool = False) -> None:
+		self._unpack_records(stream, self.records, outdir, callback, skip_unpacked)
+
+	def unpack_only(self, stream: io.BufferedReader, files: Iterable[str], outdir: str = ".", callback: Callable[[str], None] = lambda name: None,
+	                skip_unpacked: bool = False) -> None:
+		# every record is tested against files, so make that a hash lookup
+		paths = set(files)
+		self._unpack_records(stream, [record for record in self if shall_unpack(paths, record.filename)], outdir, callback, skip_unpacked)
+
+	def _unpack_records(self, stream: io.BufferedReader, records: List[Record], outdir: str, callback: Callable[[str], None], skip_unpacked: bool) -> None:
+		created_dirs: Set[str] = set()
+		data = map_archive(stream, None)
+		if data is None:
+			# without a mapping all records share the seek position of stream
+			fadvise(stream, POSIX_FADV_SEQUENTIAL)
+			# Readahead only follows the record that is being read, so have the
+			# next few (which needn't follow it in the archive) read meanwhile.
+			prefetch_stream_records(stream, records[:PREFETCH_RECORDS])
+			for i, record in enumerate(records, PREFETCH_RECORDS):
+				prefetch_stream_records(stream, records[i:i + 1])
+				record.unpack(stream, outdir, callback, None, created_dirs, skip_unpacked)
+			return
 
-	def frag_info(self) -> FragInfo:
-		frags = FragInfo(self.footer_offset + 44)
-		frags.add(self.index_offset, self.index_offset + self.index_size)
-		frags.add(self.footer_offset, frags.size)
+		def unpack_batch(batch: List[Record]) -> List[Record]:
+			for record in batch:
+				record.unpack(stream, outdir, callback, data, created_dirs, skip_unpacked)
+			return batch
 
-		for record in self.records:
-			frags.add(record.offset, record.data_offset + record.compressed_size)
+		try:
+			advise_unpack(data, records)
+			for _ in map_batches(unpack_batch, batch_records(records)):
+				pass
+		finally:
+			data.close()
+
+	def index(self) -> PakIndex:
+		"""
+		Columns of the records, built on first use and shared by everything
+		that only needs the plain numbers. Rebuilt when records was replaced
+		or changed its length. Records themselves are immutable, but an entry
+		of the list replaced in place (same length) isn't noticed: assign a
+		new list to records, or call invalidate_index() after such a change.
+		"""
+		index = self._index
+		if index is None or index.records is not self.records or len(index) != len(self.records):
+			index = self._index = PakIndex(self.records)
+		return index
+
+	def invalidate_index(self) -> None:
+		"""Drop the cached index(), for after records was modified in place."""
+		self._index = None
 
+	def frag_info(self) -> FragInfo:
+		frags = FragInfo(self.footer_offset + 44)
+		index = self.index()
+		ranges = list(zip(index.offsets, index.ends))
+		ranges.append((self.index_offset, self.index_offset + self.index_size))
+		ranges.append((self.footer_offset, frags.size))
+		frags.add_all(ranges)
 		return frags
 
 	def print_list(self, details: bool = False, human: bool = False, delim: str = "\n", sort_key_func: Optional[Callable[[Record], Any]] = None, out: IO[str] = sys.stdout) -> None:
@@ -360,7 +735,7 @@ class Pak(object):
 			out.write("    Offset        Size  Compr-Method  Compr-Size  SHA1                                      Name%s" % delim)
 			for record in records:
 				size  = size_to_str(record.uncompressed_size)
-				sha1  = hexlify(record.sha1).decode('latin1')
+				sha1  = record.sha1.hex()
 				cmeth = record.compression_method
 
 				if cmeth == COMPR_NONE:
@@ -385,11 +760,9 @@ class Pak(object):
 		else:
 			size_to_str = str
 
-		csize = 0
-		size  = 0
-		for record in self.records:
-			csize += record.compressed_size
-			size  += record.uncompressed_size
+		index = self.index()
+		csize = sum(index.csizes)
+		size  = sum(index.sizes)
 
 		frags = self.frag_info()
 
@@ -425,6 +798,47 @@ class Pak(object):
 		finally:
 			llfuse.close()
 
+class PakIndex(object):
+	"""
+	Column-wise (struct of arrays) copy of the record fields that get listed
+	and sorted. Row i of every column belongs to the i-th record.
+	"""
+	__slots__ = 'records', 'names', 'offsets', 'ends', 'sizes', 'csizes', 'methods', 'sha1', '_sha1_hex'
+
+	records: List[Record]
+	names:   List[str]
+	offsets: array[int]
+	ends:    array[int] # end of the data (data_offset + compressed_size)
+	sizes:   array[int]
+	csizes:  array[int]
+	methods: array[int]
+	sha1:    bytes # the 20 byte digests of all records back to back
+	_sha1_hex: Optional[str]
+
+	def __init__(self, records: List[Record]) -> None:
+		self.records = records
+		self.names   = [record.filename for record in records]
+		self.offsets = array('q', [record.offset for record in records])
+		self.ends    = array('q', [record.data_offset + record.compressed_size for record in records])
+		self.sizes   = array('q', [record.uncompressed_size for record in records])
+		self.csizes  = array('q', [record.compressed_size for record in records])
+		self.methods = array('I', [record.compression_method for record in records])
+		self.sha1    = b''.join([record.sha1 for record in records])
+		self._sha1_hex = None
+
+	def __len__(self) -> int:
+		return len(self.names)
+
+	def sha1_hex(self, row: int) -> str:
+		# hex encode all digests in one call the first time one is needed
+		sha1_hex = self._sha1_hex
+		if sha1_hex is None:
+			sha1_hex = self._sha1_hex = self.sha1.hex()
+		return sha1_hex[row * 40:row * 40 + 40]
+
+	def argsort(self, column: Union[List[str], array[int]], reverse: bool = False) -> List[int]:
+		return sorted(range(len(column)), key=column.__getitem__, reverse=reverse)
+
 # compare all metadata except for the filename
 def same_metadata(r1: Record, r2: Record) -> bool:
 	# data records always have offset == 0 it seems, so skip that
@@ -469,6 +883,96 @@ COMPR_METHOD_NAMES: Dict[int, str] = {
 	COMPR_BIAS_SPEED:  'bias speed'
 }
 
+class BlockCache(object):
+	"""
+	The most recently inflated compression blocks of an archive, keyed by
+	their offset. Reads (e.g. through FUSE) come in pieces that don't line up
+	with the blocks, so without it the block at every boundary is inflated
+	once for each read that touches it. Not locked, callers that read from
+	several threads at once need their own cache per thread.
+	"""
+	__slots__ = 'blocks', 'max_blocks'
+
+	blocks: OrderedDict[int, bytes]
+	max_blocks: int
+
+	def __init__(self, max_blocks: int = 64) -> None:
+		self.blocks = OrderedDict()
+		self.max_blocks = max_blocks
+
+	def inflate(self, view: memoryview, start: int, end: int, bufsize: int) -> bytes:
+		blocks = self.blocks
+		block = blocks.get(start)
+		if block is None:
+			block = blocks[start] = zlib.decompress(view[start:end], bufsize=bufsize)
+			if len(blocks) > self.max_blocks:
+				blocks.popitem(last=False)
+		else:
+			blocks.move_to_end(start)
+		return block
+
+class CompressionBlocks(object):
+	"""
+	The (start_offset, end_offset) pairs of a compressed record, stored flat in
+	one array instead of as a list of tuples. That is 16 bytes per block instead
+	of a tuple and two ints, and the tuples are only created while iterating.
+	"""
+	__slots__ = 'offsets',
+
+	offsets: array[int]
+
+	def __init__(self, offsets: array[int]) -> None:
+		self.offsets = offsets
+
+	@staticmethod
+	def frombytes(data: Union[memoryview, bytes]) -> CompressionBlocks:
+		offsets = array('Q')
+		offsets.frombytes(data)
+		if sys.byteorder != 'little':
+			offsets.byteswap()
+		return CompressionBlocks(offsets)
+
+	def tobytes(self) -> bytes:
+		if sys.byteorder != 'little':
+			offsets = array('Q', self.offsets)
+			offsets.byteswap()
+			return offsets.tobytes()
+		return self.offsets.tobytes()
+
+	def __len__(self) -> int:
+		return len(self.offsets) // 2
+
+	def __iter__(self) -> Iterator[Tuple[int, int]]:
+		offsets = iter(self.offsets)
+		return zip(offsets, offsets)
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			start, stop, step = index.indices(len(self))
+			if step == 1:
+				return CompressionBlocks(self.offsets[start * 2:max(start, stop) * 2])
+			return [self[i] for i in range(start, stop, step)]
+
+		if index < 0:
+			index += len(self)
+		if index < 0 or index * 2 >= len(self.offsets):
+			raise IndexError('block index out of range')
+		return self.offsets[index * 2], self.offsets[index * 2 + 1]
+
+	def __eq__(self, other: object) -> bool:
+		if isinstance(other, CompressionBlocks):
+			return self.offsets == other.offsets
+		if isinstance(other, list):
+			return list(self) == other
+		return NotImplemented
+
+	def __ne__(self, other: object) -> bool:
+		result = self.__eq__(other)
+		return result if result is NotImplemented else not result
+
+	def __repr__(self) -> str:
+		return repr(list(self))
+
 class Record(NamedTuple):
 	filename:               str
 	offset:                 int
@@ -477,25 +981,43 @@ class Record(NamedTuple):
 	compression_method:     int
 	timestamp:              Optional[int]
 	sha1:                   bytes
-	compression_blocks:     Optional[List[Tuple[int, int]]]
+	compression_blocks:     Optional[Sequence[Tuple[int, int]]]
 	encrypted:              bool
 	compression_block_size: Optional[int]
 
-	def sendfile(self, outfile: io.BufferedWriter, infile: io.BufferedReader) -> None:
+	def sendfile(self, outfile: io.BufferedWriter, infile: io.BufferedReader, data: Optional[mmap.mmap] = None) -> None:
 		if self.compression_method == COMPR_NONE:
-			sendfile(outfile, infile, self.data_offset, self.uncompressed_size)
+			if data is not None and sendfile is highlevel_sendfile:
+				# no in-kernel copy available, so at least write straight out of the mapping
+				data_offset = self.data_offset
+				data_end    = data_offset + self.uncompressed_size
+				if data_end > len(data):
+					raise IOError("unexpected end of file")
+				with memoryview(data) as view:
+					outfile.write(view[data_offset:data_end])
+			else:
+				sendfile(outfile, infile, self.data_offset, self.uncompressed_size)
 		elif self.compression_method == COMPR_ZLIB:
 			if self.encrypted:
 				raise NotImplementedError('zlib decompression with encryption is not implemented yet')
 			assert self.compression_blocks is not None
 			base_offset = self.base_offset
-			for start_offset, end_offset in self.compression_blocks:
-				block_size = end_offset - start_offset
-				infile.seek(base_offset + start_offset)
-				block_content = infile.read(block_size)
-				assert block_content is not None
-				block_decompress = zlib.decompress(block_content)
-				outfile.write(block_decompress)
+			# Every block but the last inflates to exactly compression_block_size,
+			# so let zlib allocate its output that big right away instead of
+			# growing it from the 16 KiB default.
+			bufsize = self.compression_block_size or zlib.DEF_BUF_SIZE
+			decompress = zlib.decompress
+			write = outfile.write
+			if data is not None:
+				with memoryview(data) as view:
+					for start_offset, end_offset in self.compression_blocks:
+						write(decompress(view[base_offset + start_offset:base_offset + end_offset], bufsize=bufsize))
+			else:
+				# tell the kernel the whole range up front, read_blocks() only
+				# asks for a few MiB at a time
+				fadvise(infile, POSIX_FADV_WILLNEED, self.data_offset, self.compressed_size)
+				for block_content in read_blocks(infile, base_offset, self.compression_blocks):
+					write(decompress(block_content, bufsize=bufsize))
 		else:
 			raise NotImplementedError('decompression is not implemented yet')
 
@@ -503,7 +1025,7 @@ class Record(NamedTuple):
 	def base_offset(self):
 		return 0
 
-	def read(self, data: Union[memoryview, bytes, mmap.mmap], offset: int, size: int) -> Union[bytes, bytearray]:
+	def read(self, data: Union[memoryview, bytes, mmap.mmap], offset: int, size: int, block_cache: Optional[BlockCache] = None) -> Union[bytes, bytearray]:
 		if self.encrypted:
 			raise NotImplementedError('decryption is not supported')
 
@@ -519,8 +1041,16 @@ class Record(NamedTuple):
 		elif self.compression_method == COMPR_ZLIB:
 			assert self.compression_blocks is not None
 			base_offset = self.base_offset
-			buffer = bytearray()
-			end_offset = offset + size
+			uncompressed_size = self.uncompressed_size
+
+			if offset >= uncompressed_size:
+				return bytearray()
+
+			# the result length is known, so allocate it once and copy every
+			# inflated block right into its place
+			end_offset = min(offset + size, uncompressed_size)
+			buffer = bytearray(end_offset - offset)
+			write_pos = 0
 
 			compression_block_size = self.compression_block_size
 			assert compression_block_size
@@ -528,33 +1058,105 @@ class Record(NamedTuple):
 			end_block_index   = end_offset // compression_block_size
 
 			current_offset = compression_block_size * start_block_index
-			for block_start_offset, block_end_offset in self.compression_blocks[start_block_index:end_block_index + 1]:
-				block_size = block_end_offset - block_start_offset
-
-				block_content = data[base_offset + block_start_offset:base_offset + block_end_offset]
-				block_decompress = zlib.decompress(block_content)
-
-				next_offset = current_offset + len(block_decompress)
-				if current_offset >= offset:
-					buffer.extend(block_decompress[:end_offset - current_offset])
-				else:
-					buffer.extend(block_decompress[offset - current_offset:end_offset - current_offset])
-
-				current_offset = next_offset
+			# zlib reads the compressed block straight out of the mapping and gets
+			# an output buffer that fits a whole block from the start
+			with memoryview(data) as view:
+				for block_start_offset, block_end_offset in self.compression_blocks[start_block_index:end_block_index + 1]:
+					if block_cache is None:
+						block_decompress = memoryview(zlib.decompress(view[base_offset + block_start_offset:base_offset + block_end_offset], bufsize=compression_block_size))
+					else:
+						block_decompress = memoryview(block_cache.inflate(view, base_offset + block_start_offset, base_offset + block_end_offset, compression_block_size))
+
+					start = max(offset - current_offset, 0)
+					end   = min(end_offset - current_offset, len(block_decompress))
+					if end > start:
+						buffer[write_pos:write_pos + end - start] = block_decompress[start:end]
+						write_pos += end - start
+
+					current_offset += len(block_decompress)
+
+			if write_pos < len(buffer):
+				# blocks inflated to less than expected
+				del buffer[write_pos:]
 			return buffer
 		else:
 			raise NotImplementedError(f'decompression method {self.compression_method} is not supported')
 
-	def unpack(self, stream: io.BufferedReader, outdir: str = ".", callback: Callable[[str], None] = lambda name: None) -> None:
-		prefix, name = os.path.split(self.filename)
-		prefix = os.path.join(outdir,prefix)
-		if not os.path.exists(prefix):
-			os.makedirs(prefix)
-		name = os.path.join(prefix,name)
+	def unpack(self, stream: io.BufferedReader, outdir: str = ".", callback: Callable[[str], None] = lambda name: None, data: Optional[mmap.mmap] = None,
+	           created_dirs: Optional[Set[str]] = None, skip_unpacked: bool = False) -> None:
+		if self.encrypted:
+			# fail before creating the file, sendfile() would copy the cipher text as is
+			raise NotImplementedError('decryption is not supported')
+
+		name = os.path.join(outdir,self.filename)
+		if skip_unpacked and self.is_unpacked(name):
+			return
+
+		prefix = os.path.dirname(name)
+		# created_dirs is shared by all records of one unpack run, so every
+		# directory is only created (and its parents are only stat'ed) once
+		if prefix and (created_dirs is None or prefix not in created_dirs):
+			# exist_ok: another unpack thread might create it concurrently
+			os.makedirs(prefix, exist_ok=True)
+			if created_dirs is not None:
+				created_dirs.add(prefix)
 		callback(name)
+		if data is not None and self.compression_method == COMPR_ZLIB and self.uncompressed_size >= MAP_OUTPUT_SIZE:
+			self.unpack_mapped(name, data)
+			return
 		fp: io.BufferedWriter
-		with open(name, "wb") as fp: # type: ignore
-			self.sendfile(fp, stream)
+		# zlib blocks are written one by one, buffer up to a few of them per write()
+		buffering = max(DEFAULT_BUFFER_SIZE, min(self.uncompressed_size, STREAM_BUFFER_SIZE))
+		with open(name, "wb", buffering=buffering) as fp: # type: ignore
+			self.sendfile(fp, stream, data)
+
+	def is_unpacked(self, name: str) -> bool:
+		"""
+		Whether the file name already has the content of this record. Only
+		stored records can be checked, for compressed ones the checksum is
+		over the compressed blocks and not over the file content.
+		"""
+		if self.compression_method != COMPR_NONE:
+			return False
+
+		try:
+			# the cheap size check first, only hash when that matches
+			if os.stat(name).st_size != self.uncompressed_size:
+				return False
+			return sha1_file(name) == self.sha1
+		except OSError:
+			return False
+
+	def unpack_mapped(self, name: str, data: mmap.mmap) -> None:
+		assert self.compression_blocks is not None
+		size = self.uncompressed_size
+		base_offset = self.base_offset
+		bufsize = self.compression_block_size or zlib.DEF_BUF_SIZE
+
+		with open(name, "w+b") as fp:
+			fp.truncate(size)
+			if HAS_POSIX_FALLOCATE:
+				# reserve the blocks, running out of space while writing
+				# through the mapping would be a SIGBUS instead of an OSError
+				try:
+					os.posix_fallocate(fp.fileno(), 0, size)
+				except OSError:
+					pass
+
+			# inflated blocks are copied into the page cache directly, no write() per block
+			decompress = zlib.decompress
+			with mmap.mmap(fp.fileno(), size) as out, memoryview(out) as out_view, memoryview(data) as view:
+				pos = 0
+				for start_offset, end_offset in self.compression_blocks:
+					block = decompress(view[base_offset + start_offset:base_offset + end_offset], bufsize=bufsize)
+					end = pos + len(block)
+					if end > size:
+						raise IOError('data inflates to more than %d bytes' % size)
+					out_view[pos:end] = block
+					pos = end
+
+				if pos != size:
+					raise IOError('data inflates to %d bytes instead of %d' % (pos, size))
 
 	@property
 	def data_offset(self) -> int:
@@ -566,7 +1168,8 @@ class Record(NamedTuple):
 
 	@property
 	def index_size(self) -> int:
-		name_size = 4 + len(self.filename.replace(os.path.sep,'/').encode('utf-8')) + 1
+		filename = self.filename if SEP_IS_SLASH else self.filename.replace(os.path.sep,'/')
+		name_size = 4 + len(filename.encode('utf-8')) + 1
 		return name_size + self.header_size
 
 	@property
@@ -599,7 +1202,7 @@ class RecordV3(Record):
 	__slots__ = ()
 
 	def __new__(cls, filename: str, offset: int, compressed_size: int, uncompressed_size: int, compression_method: int, sha1: bytes,
-				compression_blocks: Optional[List[Tuple[int, int]]], encrypted: bool, compression_block_size: Optional[int]) -> RecordV3:
+				compression_blocks: Optional[Sequence[Tuple[int, int]]], encrypted: bool, compression_block_size: Optional[int]) -> RecordV3:
 		return Record.__new__(cls, filename, offset, compressed_size, uncompressed_size,
 							  compression_method, None, sha1, compression_blocks, encrypted,
 							  compression_block_size) # type: ignore
@@ -609,7 +1212,8 @@ class RecordV3(Record):
 		size = 53
 		if self.compression_method != COMPR_NONE:
 			assert self.compression_blocks is not None
-			size += len(self.compression_blocks) * 16
+			# block count and the blocks
+			size += 4 + len(self.compression_blocks) * 16
 		return size
 
 # XXX: Don't know at which version exactly the change happens.
@@ -619,17 +1223,51 @@ class RecordV7(RecordV3):
 	def base_offset(self):
 		return self.offset
 
+# precompiled formats of the on-disk structures
+_FOOTER         = Struct('<IIQQ20s')
+_PATH_LEN       = Struct('<i')
+_U32            = Struct('<I')
+_U64            = Struct('<Q')
+_RECORD_V1      = Struct('<QQQIQ20s')
+_RECORD_V2      = Struct('<QQQI20s')
+_RECORD_V3_HEAD = _RECORD_V2
+_RECORD_V3_TAIL = Struct('<BI')
+_BLOCK          = Struct('<QQ')
+_RECORD_V3      = Struct('<QQQI20sBI')
+
+_pack_u32 = _U32.pack
+
+# Paths in archives are separated by '/'. Where that is the native separator
+# too, names are used as they are instead of going through replace().
+SEP_IS_SLASH = os.path.sep == '/'
+
 def read_path(stream: io.BufferedReader, encoding: str = 'utf-8') -> str:
-	path_len, = st_unpack('<i',stream.read(4))
+	path_len, = _PATH_LEN.unpack(stream.read(_PATH_LEN.size))
 	if path_len < 0:
 		# in at least some format versions, this indicates a UTF-16 path
 		path_len = -2 * path_len
 		encoding = 'utf-16le'
-	return stream.read(path_len).decode(encoding).rstrip('\0').replace('/',os.path.sep)
+	path = stream.read(path_len).decode(encoding).rstrip('\0')
+	return path if SEP_IS_SLASH else path.replace('/',os.path.sep)
+
+def unpack_path(buf: Union[memoryview, bytes, mmap.mmap], offset: int, encoding: str = 'utf-8') -> Tuple[str, int]:
+	path_len, = _PATH_LEN.unpack_from(buf, offset)
+	offset += _PATH_LEN.size
+	if path_len < 0:
+		# in at least some format versions, this indicates a UTF-16 path
+		path_len = -2 * path_len
+		encoding = 'utf-16le'
+	end = offset + path_len
+	if end > len(buf):
+		raise ValueError('index bleeds into footer')
+	path = str(buf[offset:end], encoding).rstrip('\0')
+	return path if SEP_IS_SLASH else path.replace('/',os.path.sep), end
 
 def pack_path(path: str, encoding: str = 'utf-8') -> bytes:
-	encoded_path = path.replace(os.path.sep, '/').encode('utf-8') + b'\0'
-	return st_pack('<I', len(encoded_path)) + encoded_path
+	if not SEP_IS_SLASH:
+		path = path.replace(os.path.sep, '/')
+	encoded_path = path.encode('utf-8') + b'\0'
+	return _pack_u32(len(encoded_path)) + encoded_path
 
 def write_path(stream: io.BufferedWriter, path: str, encoding: str = 'utf-8') -> bytes:
 	data = pack_path(path,encoding)
@@ -637,24 +1275,23 @@ def write_path(stream: io.BufferedWriter, path: str, encoding: str = 'utf-8') ->
 	return data
 
 def read_record_v1(stream: io.BufferedReader, filename: str) -> RecordV1:
-	return RecordV1(filename, *st_unpack('<QQQIQ20s',stream.read(56)))
+	return RecordV1(filename, *_RECORD_V1.unpack(stream.read(_RECORD_V1.size)))
 
 def read_record_v2(stream: io.BufferedReader, filename: str) -> RecordV2:
-	return RecordV2(filename, *st_unpack('<QQQI20s',stream.read(48)))
+	return RecordV2(filename, *_RECORD_V2.unpack(stream.read(_RECORD_V2.size)))
 
 def read_record_v3(stream: io.BufferedReader, filename: str) -> RecordV3:
 	offset, compressed_size, uncompressed_size, compression_method, sha1 = \
-		st_unpack('<QQQI20s',stream.read(48))
+		_RECORD_V3_HEAD.unpack(stream.read(_RECORD_V3_HEAD.size))
 
-	blocks: Optional[List[Tuple[int, int]]]
+	blocks: Optional[CompressionBlocks]
 	if compression_method != COMPR_NONE:
-		block_count, = st_unpack('<I',stream.read(4))
-		blocks_bin = st_unpack('<%dQ' % (block_count * 2), stream.read(16 * block_count))
-		blocks = [(blocks_bin[i], blocks_bin[i+1]) for i in range(0, block_count * 2, 2)]
+		block_count, = _U32.unpack(stream.read(_U32.size))
+		blocks = CompressionBlocks.frombytes(stream.read(_BLOCK.size * block_count))
 	else:
 		blocks = None
 
-	encrypted, compression_block_size = st_unpack('<BI',stream.read(5))
+	encrypted, compression_block_size = _RECORD_V3_TAIL.unpack(stream.read(_RECORD_V3_TAIL.size))
 
 	return RecordV3(filename, offset, compressed_size, uncompressed_size, compression_method,
 					sha1, blocks, encrypted != 0, compression_block_size) # type: ignore
@@ -663,21 +1300,122 @@ read_record_v4 = read_record_v3
 
 def read_record_v7(stream: io.BufferedReader, filename: str) -> RecordV3:
 	offset, compressed_size, uncompressed_size, compression_method, sha1 = \
-		st_unpack('<QQQI20s',stream.read(48))
+		_RECORD_V3_HEAD.unpack(stream.read(_RECORD_V3_HEAD.size))
 
-	blocks: Optional[List[Tuple[int, int]]]
+	blocks: Optional[CompressionBlocks]
 	if compression_method != COMPR_NONE:
-		block_count, = st_unpack('<I',stream.read(4))
-		blocks_bin = st_unpack('<%dQ' % (block_count * 2), stream.read(16 * block_count))
-		blocks = [(blocks_bin[i], blocks_bin[i+1]) for i in range(0, block_count * 2, 2)]
+		block_count, = _U32.unpack(stream.read(_U32.size))
+		blocks = CompressionBlocks.frombytes(stream.read(_BLOCK.size * block_count))
 	else:
 		blocks = None
 
-	encrypted, compression_block_size = st_unpack('<BI',stream.read(5))
+	encrypted, compression_block_size = _RECORD_V3_TAIL.unpack(stream.read(_RECORD_V3_TAIL.size))
 
 	return RecordV7(filename, offset, compressed_size, uncompressed_size, compression_method,
 					sha1, blocks, encrypted != 0, compression_block_size) # type: ignore
 
+# The unpack_record_v* functions parse a record from a buffer at the given
+# offset and return it together with the offset right after the record, so
+# the whole index can be walked with an integer cursor instead of many reads.
+# They run once per entry, so the Struct methods and sizes are bound as
+# default arguments (local lookups) instead of being fetched from the module
+# globals on every call. Don't pass them.
+def unpack_record_v1(buf: Union[memoryview, bytes, mmap.mmap], offset: int, filename: str,
+                     _unpack_from=_RECORD_V1.unpack_from, _size: int = _RECORD_V1.size) -> Tuple[RecordV1, int]:
+	return RecordV1(filename, *_unpack_from(buf, offset)), offset + _size
+
+def unpack_record_v2(buf: Union[memoryview, bytes, mmap.mmap], offset: int, filename: str,
+                     _unpack_from=_RECORD_V2.unpack_from, _size: int = _RECORD_V2.size) -> Tuple[RecordV2, int]:
+	return RecordV2(filename, *_unpack_from(buf, offset)), offset + _size
+
+def _unpack_record_v3_fields(buf: Union[memoryview, bytes, mmap.mmap], offset: int,
+                             _head_from=_RECORD_V3_HEAD.unpack_from, _head_size: int = _RECORD_V3_HEAD.size,
+                             _u32_from=_U32.unpack_from, _u32_size: int = _U32.size,
+                             _blocks_frombytes=CompressionBlocks.frombytes, _block_size: int = _BLOCK.size,
+                             _tail_from=_RECORD_V3_TAIL.unpack_from, _tail_size: int = _RECORD_V3_TAIL.size) -> Tuple[Tuple[Any, ...], int]:
+	offset_field, compressed_size, uncompressed_size, compression_method, sha1 = \
+		_head_from(buf, offset)
+	offset += _head_size
+
+	blocks: Optional[CompressionBlocks]
+	if compression_method != COMPR_NONE:
+		block_count, = _u32_from(buf, offset)
+		offset += _u32_size
+		end = offset + _block_size * block_count
+		if end > len(buf):
+			raise ValueError('index bleeds into footer')
+		blocks = _blocks_frombytes(buf[offset:end])
+		offset = end
+	else:
+		blocks = None
+
+	encrypted, compression_block_size = _tail_from(buf, offset)
+	offset += _tail_size
+
+	return (offset_field, compressed_size, uncompressed_size, compression_method,
+			sha1, blocks, encrypted != 0, compression_block_size), offset
+
+def unpack_record_v3(buf: Union[memoryview, bytes, mmap.mmap], offset: int, filename: str) -> Tuple[RecordV3, int]:
+	fields, offset = _unpack_record_v3_fields(buf, offset)
+	return RecordV3(filename, *fields), offset # type: ignore
+
+unpack_record_v4 = unpack_record_v3
+
+def unpack_record_v7(buf: Union[memoryview, bytes, mmap.mmap], offset: int, filename: str) -> Tuple[RecordV7, int]:
+	fields, offset = _unpack_record_v3_fields(buf, offset)
+	return RecordV7(filename, *fields), offset # type: ignore
+
+_READ_RECORD: Dict[int, Callable[[io.BufferedReader, str], Record]] = {
+	1: read_record_v1,
+	2: read_record_v2,
+	3: read_record_v3,
+	4: read_record_v4,
+	7: read_record_v7,
+}
+
+_UNPACK_RECORD: Dict[int, Callable[[Union[memoryview, bytes, mmap.mmap], int, str], Tuple[Record, int]]] = {
+	1: unpack_record_v1,
+	2: unpack_record_v2,
+	3: unpack_record_v3,
+	4: unpack_record_v4,
+	7: unpack_record_v7,
+}
+
+def unpack_records(
+		buf: Union[memoryview, bytes, mmap.mmap],
+		offset: int,
+		count: int,
+		unpack_record: Callable[[Union[memoryview, bytes, mmap.mmap], int, str], Tuple[Record, int]],
+		encoding: str = 'utf-8') -> Tuple[List[Record], int]:
+	# This is the hot loop when opening big archives. It does the same as
+	# calling unpack_path() and unpack_record() per entry, but with the path
+	# parsing inlined and everything looked up once up front.
+	records: List[Record] = []
+	append        = records.append
+	path_len_from = _PATH_LEN.unpack_from
+	path_len_size = _PATH_LEN.size
+	buf_size      = len(buf)
+	sep           = None if SEP_IS_SLASH else os.path.sep
+
+	for _ in range(count):
+		path_len, = path_len_from(buf, offset)
+		offset += path_len_size
+		if path_len < 0:
+			path_len = -2 * path_len
+			path_encoding = 'utf-16le'
+		else:
+			path_encoding = encoding
+		end = offset + path_len
+		if end > buf_size:
+			raise ValueError('index bleeds into footer')
+		filename = str(buf[offset:end], path_encoding).rstrip('\0')
+		if sep is not None:
+			filename = filename.replace('/', sep)
+		record, offset = unpack_record(buf, end, filename)
+		append(record)
+
+	return records, offset
+
 def write_data(
 		archive: io.BufferedWriter,
 		fh: io.BufferedReader,
@@ -692,100 +1430,170 @@ def write_data(
 	if encrypted:
 		raise NotImplementedError("encryption is not implemented")
 
-	buf_size = DEFAULT_BUFFER_SIZE
-	buf = bytearray(buf_size)
-	bytes_left = size
-	hasher = hashlib.sha1()
-	while bytes_left > 0:
-		data: Union[bytes, bytearray]
-		if bytes_left >= buf_size:
-			n = fh.readinto(buf)
-			data = buf
-			if n is None or n < buf_size:
-				raise IOError('unexpected end of file')
+	if size > 0:
+		try:
+			archive.fileno()
+			data = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+		except (AttributeError, io.UnsupportedOperation, OSError, ValueError):
+			pass
 		else:
-			opt_data = fh.read(bytes_left)
-			assert opt_data is not None
-			n = len(opt_data)
-			if n < bytes_left:
+			# Both ends are real files: hash the input through a mapping and
+			# leave the copy to the kernel, nothing passes through a buffer.
+			hasher = new_sha1()
+			with data:
+				if len(data) < size:
+					raise IOError('unexpected end of file')
+				with memoryview(data) as view:
+					hasher.update(view[:size])
+
+			archive.flush()
+			data_offset = archive.tell()
+			sendfile(archive, fh, 0, size)
+			# the copy went around the buffer of archive, resync its position
+			archive.seek(data_offset + size, 0)
+			return size, hasher.digest()
+
+	bytes_left = size
+	hasher = new_sha1()
+	# Read every chunk (the tail included) into the same buffer and hand the
+	# very same memoryview to the hasher and the archive, no bytes are created.
+	with pooled_buffer() as buf, memoryview(buf) as view:
+		buf_size = len(buf)
+		while bytes_left > 0:
+			chunk = view if bytes_left >= buf_size else view[:bytes_left]
+			n = fh.readinto(chunk) or 0
+			if n < len(chunk):
 				raise IOError('unexpected end of file')
-			data = opt_data
-		bytes_left -= n
-		hasher.update(data)
-		archive.write(data)
+			bytes_left -= n
+			hasher.update(chunk)
+			archive.write(chunk)
 
 	return size, hasher.digest()
 
+_compress_executor: Optional[ThreadPoolExecutor] = None
+# compress_blocks_zlib() is entered from several threads at once (e.g. by the
+# parallel record writes of update()), this makes sure only one pool is made
+_compress_executor_lock = threading.Lock()
+
+def _get_compress_executor() -> ThreadPoolExecutor:
+	global _compress_executor
+
+	with _compress_executor_lock:
+		if _compress_executor is None:
+			_compress_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+		return _compress_executor
+
+@atexit.register
+def _shutdown_compress_executor() -> None:
+	global _compress_executor
+
+	with _compress_executor_lock:
+		executor, _compress_executor = _compress_executor, None
+	if executor is not None:
+		executor.shutdown()
+
+# Untouched deflate state that every block is compressed with a copy of.
+# Copying it is cheaper than zlib.compress() setting up a fresh state, which
+# shows for the many small files (single short blocks) in typical archives.
+# Same settings as zlib.compress(), so the output is the same.
+_deflate = zlib.compressobj()
+
+def zlib_compress(data: Union[bytes, bytearray, memoryview]) -> bytes:
+	compressor = _deflate.copy()
+	return compressor.compress(data) + compressor.flush()
+
+def compress_blocks_zlib(fh: io.BufferedReader, size: int, block_size: int) -> Iterator[bytes]:
+	"""
+	Read size bytes from fh and yield them zlib compressed, one block of
+	block_size bytes at a time and in order. zlib releases the GIL, so the
+	blocks are compressed in parallel on a shared thread pool while at most
+	two blocks per core are read ahead.
+	"""
+	if size <= block_size:
+		# not worth a round trip through the pool
+		if size > 0:
+			data = fh.read(size) or b''
+			if len(data) < size:
+				raise IOError('unexpected end of file')
+			yield zlib_compress(data)
+		return
+
+	executor = _get_compress_executor()
+	read_ahead = 2 * (os.cpu_count() or 1)
+
+	pending: deque = deque()
+	bytes_left = size
+	while bytes_left > 0 or pending:
+		while bytes_left > 0 and len(pending) < read_ahead:
+			block_len = min(bytes_left, block_size)
+			data = fh.read(block_len) or b''
+			if len(data) < block_len:
+				raise IOError('unexpected end of file')
+			bytes_left -= block_len
+			pending.append(executor.submit(zlib_compress, data))
+
+		yield pending.popleft().result()
+
 def write_data_zlib(
 		archive: io.BufferedWriter,
 		fh: io.BufferedReader,
 		size: int,
 		compression_method: int = COMPR_NONE,
 		encrypted: bool = False,
-		compression_block_size: int = 65536
-) -> Tuple[int, bytes, int, List[int]]:
+		compression_block_size: int = 65536,
+		data_offset: Optional[int] = None
+) -> Tuple[int, bytes, int, CompressionBlocks]:
+	"""
+	Write the compressed blocks and return what goes into the record header.
+	The block offsets are relative to data_offset, which defaults to the
+	position of archive (pass it if archive is a temporary buffer).
+	"""
 	if encrypted:
 		raise NotImplementedError("encryption is not implemented")
 
 	buf_size = compression_block_size
 	block_count = int(math.ceil(size / compression_block_size))
-	base_offset = archive.tell()
-
-	archive.write(st_pack('<I',block_count))
+	cur_offset = archive.tell() if data_offset is None else data_offset
 
-	# Seek Skip Offset
-	archive.seek(block_count * 8 * 2, 1)
-
-	record = st_pack('<BI', int(encrypted), compression_block_size)
-	archive.write(record)
-
-	cur_offset = base_offset + 4 + block_count * 8 * 2 + 5
-
-	compress_blocks = [0] * block_count * 2
+	compress_blocks = array('Q', bytes(block_count * 16))
 	compressed_size = 0
 	compress_block_no = 0
 
-	buf = bytearray(buf_size)
-	bytes_left: int = size
-	hasher = hashlib.sha1()
-	while bytes_left > 0:
-		n: int
-		if bytes_left >= buf_size:
-			n = fh.readinto(buf) or 0
-			data = zlib.compress(memoryview(buf))
-
-			compressed_size += len(data)
-			compress_blocks[compress_block_no * 2] = cur_offset
-			cur_offset += len(data)
-			compress_blocks[compress_block_no * 2 + 1] = cur_offset
-			compress_block_no += 1
-
-			if n < buf_size:
-				raise IOError('unexpected end of file')
-		else:
-			data = fh.read(bytes_left) or b''
-			n = len(data)
-
-			data = zlib.compress(data)
-			compressed_size += len(data)
-			compress_blocks[compress_block_no * 2] = cur_offset
-			cur_offset += len(data)
-			compress_blocks[compress_block_no * 2 + 1] = cur_offset
-			compress_block_no += 1
+	hasher = new_sha1()
+	for data in compress_blocks_zlib(fh, size, buf_size):
+		compressed_size += len(data)
+		compress_blocks[compress_block_no * 2] = cur_offset
+		cur_offset += len(data)
+		compress_blocks[compress_block_no * 2 + 1] = cur_offset
+		compress_block_no += 1
 
-			if n < bytes_left:
-				raise IOError('unexpected end of file')
-		bytes_left -= n
 		hasher.update(data)
 		archive.write(data)
 
-	cur_offset = archive.tell()
+	return compressed_size, hasher.digest(), block_count, CompressionBlocks(compress_blocks)
 
-	archive.seek(base_offset + 4, 0)
-	archive.write(st_pack('<%dQ' % (block_count * 2), *compress_blocks))
-	archive.seek(cur_offset, 0)
+# Records up to this size are put together in memory and written with their
+# header in one go. Bigger ones are streamed behind a gap that the header is
+# written into afterwards, because the header holds the sha1 of the data.
+SMALL_RECORD_SIZE = 1 << 20
 
-	return compressed_size, hasher.digest(), block_count, compress_blocks
+def begin_record(archive: io.BufferedWriter, header_size: int, size: int) -> Tuple[int, IO[bytes]]:
+	record_offset = archive.tell()
+	if size <= SMALL_RECORD_SIZE:
+		return record_offset, io.BytesIO()
+	archive.seek(record_offset + header_size, 0)
+	return record_offset, archive
+
+def end_record(archive: io.BufferedWriter, record_offset: int, out: IO[bytes], header: bytes) -> None:
+	if out is archive:
+		data_end = archive.tell()
+		archive.seek(record_offset, 0)
+		archive.write(header)
+		archive.seek(data_end, 0)
+	else:
+		assert isinstance(out, io.BytesIO)
+		archive.write(header)
+		archive.write(out.getbuffer())
 
 def write_record_v1(
 		archive: io.BufferedWriter,
@@ -796,26 +1604,16 @@ def write_record_v1(
 	if encrypted:
 		raise ValueError('version 1 does not support encryption')
 
-	record_offset = archive.tell()
-
 	st = os.fstat(fh.fileno())
 	size = st.st_size
 	# XXX: timestamp probably needs multiplication with some factor?
-	record = st_pack('<16xQIQ20x',size,compression_method,int(st.st_mtime))
-	archive.write(record)
-
-	compressed_size, sha1 = write_data(archive,fh,size,compression_method,encrypted,compression_block_size)
-	data_end = archive.tell()
-
-	archive.seek(record_offset+8, 0)
-	archive.write(st_pack('<Q',compressed_size))
+	timestamp = int(st.st_mtime)
 
-	archive.seek(record_offset+36, 0)
-	archive.write(sha1)
+	record_offset, out = begin_record(archive, _RECORD_V1.size, size)
+	compressed_size, sha1 = write_data(out,fh,size,compression_method,encrypted,compression_block_size)
+	end_record(archive, record_offset, out, _RECORD_V1.pack(0,compressed_size,size,compression_method,timestamp,sha1))
 
-	archive.seek(data_end, 0)
-
-	return st_pack('<QQQIQ20s',record_offset,compressed_size,size,compression_method,int(st.st_mtime),sha1)
+	return _RECORD_V1.pack(record_offset,compressed_size,size,compression_method,timestamp,sha1)
 
 def write_record_v2(
 		archive: io.BufferedWriter,
@@ -826,25 +1624,14 @@ def write_record_v2(
 	if encrypted:
 		raise ValueError('version 2 does not support encryption')
 
-	record_offset = archive.tell()
-
 	st = os.fstat(fh.fileno())
 	size = st.st_size
-	record = st_pack('<16xQI20x',size,compression_method)
-	archive.write(record)
-
-	compressed_size, sha1 = write_data(archive,fh,size,compression_method,encrypted,compression_block_size)
-	data_end = archive.tell()
-
-	archive.seek(record_offset+8, 0)
-	archive.write(st_pack('<Q',compressed_size))
 
-	archive.seek(record_offset+28, 0)
-	archive.write(sha1)
+	record_offset, out = begin_record(archive, _RECORD_V2.size, size)
+	compressed_size, sha1 = write_data(out,fh,size,compression_method,encrypted,compression_block_size)
+	end_record(archive, record_offset, out, _RECORD_V2.pack(0,compressed_size,size,compression_method,sha1))
 
-	archive.seek(data_end, 0)
-
-	return st_pack('<QQQI20s',record_offset,compressed_size,size,compression_method,sha1)
+	return _RECORD_V2.pack(record_offset,compressed_size,size,compression_method,sha1)
 
 def write_record_v3(
 		archive: io.BufferedWriter,
@@ -855,36 +1642,29 @@ def write_record_v3(
 	if compression_method != COMPR_NONE and compression_method != COMPR_ZLIB:
 		raise NotImplementedError("compression is not implemented")
 
-	record_offset = archive.tell()
-
 	if compression_block_size == 0 and compression_method == COMPR_ZLIB:
 		compression_block_size = 65536
 
 	st = os.fstat(fh.fileno())
 	size = st.st_size
-	record = st_pack('<16xQI20x',size,compression_method)
-	archive.write(record)
+	tail = _RECORD_V3_TAIL.pack(int(encrypted),compression_block_size)
 
 	if compression_method == COMPR_ZLIB:
-		compressed_size, sha1, block_count, blocks = write_data_zlib(archive,fh,size,compression_method,encrypted,compression_block_size)
+		# the size of the block table is known up front, only its content isn't
+		block_count = int(math.ceil(size / compression_block_size))
+		header_size = _RECORD_V3_HEAD.size + _U32.size + _BLOCK.size * block_count + _RECORD_V3_TAIL.size
+		record_offset, out = begin_record(archive, header_size, size)
+		compressed_size, sha1, block_count, blocks = write_data_zlib(out,fh,size,compression_method,encrypted,compression_block_size,record_offset + header_size)
+		blocks_bytes = _pack_u32(block_count) + blocks.tobytes() + tail
+		end_record(archive, record_offset, out, _RECORD_V3_HEAD.pack(0,compressed_size,size,compression_method,sha1) + blocks_bytes)
+
+		return _RECORD_V3_HEAD.pack(record_offset,compressed_size,size,compression_method,sha1) + blocks_bytes
 	else:
-		record = st_pack('<BI',int(encrypted),compression_block_size)
-		archive.write(record)
-		compressed_size, sha1 = write_data(archive,fh,size,compression_method,encrypted,compression_block_size)
-	data_end = archive.tell()
+		record_offset, out = begin_record(archive, _RECORD_V3.size, size)
+		compressed_size, sha1 = write_data(out,fh,size,compression_method,encrypted,compression_block_size)
+		end_record(archive, record_offset, out, _RECORD_V3_HEAD.pack(0,compressed_size,size,compression_method,sha1) + tail)
 
-	archive.seek(record_offset+8, 0)
-	archive.write(st_pack('<Q',compressed_size))
-
-	archive.seek(record_offset+28, 0)
-	archive.write(sha1)
-
-	archive.seek(data_end, 0)
-
-	if compression_method == COMPR_ZLIB:
-		return st_pack('<QQQI20s',record_offset,compressed_size,size,compression_method,sha1) + st_pack('<I%dQ' % (block_count * 2), block_count, *blocks) + st_pack('<BI',int(encrypted),compression_block_size)
-	else:
-		return st_pack('<QQQI20sBI',record_offset,compressed_size,size,compression_method,sha1,int(encrypted),compression_block_size)
+		return _RECORD_V3.pack(record_offset,compressed_size,size,compression_method,sha1,int(encrypted),compression_block_size)
 
 def read_index(
 		stream: io.BufferedReader,
@@ -895,8 +1675,8 @@ def read_index(
 		ignore_null_checksums: bool = False) -> Pak:
 	stream.seek(-44, 2)
 	footer_offset = stream.tell()
-	footer = stream.read(44)
-	magic, version, index_offset, index_size, index_sha1 = st_unpack('<IIQQ20s',footer)
+	footer = stream.read(_FOOTER.size)
+	magic, version, index_offset, index_size, index_sha1 = _FOOTER.unpack(footer)
 
 	if not ignore_magic and magic != 0x5A6F12E1:
 		raise ValueError('illegal file magic: 0x%08x' % magic)
@@ -904,48 +1684,92 @@ def read_index(
 	if force_version is not None:
 		version = force_version
 
-	read_record: Callable[[io.BufferedReader, str], Record]
-	if version == 1:
-		read_record = read_record_v1
-
-	elif version == 2:
-		read_record = read_record_v2
-
-	elif version == 3:
-		read_record = read_record_v3
-
-	elif version == 4:
-		read_record = read_record_v4
-
-	elif version == 7:
-		read_record = read_record_v7
-
-	else:
+	try:
+		unpack_record = _UNPACK_RECORD[version]
+	except KeyError:
 		raise ValueError('unsupported version: %d' % version)
 
 	if index_offset + index_size > footer_offset:
 		raise ValueError('illegal index offset/size')
 
+	# Read everything up to the footer in one go and walk it with a cursor.
+	# Normally that is exactly the index, but parse whatever the entry count
+	# demands as long as it doesn't reach into the footer.
 	stream.seek(index_offset, 0)
+	index = memoryview(stream.read(footer_offset - index_offset))
 
-	mount_point = read_path(stream, encoding)
-	entry_count = st_unpack('<I',stream.read(4))[0]
-
-	pak = Pak(version, index_offset, index_size, footer_offset, index_sha1, mount_point)
-
-	for i in range(entry_count):
-		filename = read_path(stream, encoding)
-		record   = read_record(stream, filename)
-		pak.records.append(record)
+	try:
+		mount_point, pos = unpack_path(index, 0, encoding)
+		entry_count, = _U32.unpack_from(index, pos)
+		pos += _U32.size
 
-	if stream.tell() > footer_offset:
+		records, pos = unpack_records(index, pos, entry_count, unpack_record, encoding)
+	except struct_error:
 		raise ValueError('index bleeds into footer')
 
+	pak = Pak(version, index_offset, index_size, footer_offset, index_sha1, mount_point, records)
+
 	if check_integrity:
 		pak.check_integrity(stream, ignore_null_checksums=ignore_null_checksums)
 
 	return pak
 
+def iter_files(files_or_dirs: Iterable[str]) -> Iterator[str]:
+	"""
+	Yield the given files and all files below the given directories, with the
+	same rules as os.walk(). Only the given names are stat()ed, the type of
+	everything below them comes from the os.scandir() entries.
+	"""
+	for name in files_or_dirs:
+		if not os.path.isdir(name):
+			yield name
+			continue
+
+		dirs = [name]
+		while dirs:
+			dirpath = dirs.pop()
+			try:
+				entries = os.scandir(dirpath)
+			except OSError:
+				# os.walk() skips unreadable directories too
+				continue
+
+			with entries:
+				for entry in entries:
+					try:
+						is_dir = entry.is_dir()
+					except OSError:
+						is_dir = False
+
+					if not is_dir:
+						yield entry.path
+					elif not entry.is_symlink():
+						# like os.walk(), don't descend into symlinked directories
+						dirs.append(entry.path)
+
+def walk_files(files_or_dirs: Iterable[str]) -> List[str]:
+	"""
+	List the same files as iter_files(), but walk each given directory in its
+	own thread. os.scandir() releases the GIL, so multiple trees on an SSD
+	(or a network share) are read concurrently. The order is unspecified.
+	"""
+	files: List[str] = []
+	dirs:  List[str] = []
+	for name in files_or_dirs:
+		if os.path.isdir(name):
+			dirs.append(name)
+		else:
+			files.append(name)
+
+	if len(dirs) < 2:
+		files.extend(iter_files(dirs))
+		return files
+
+	with ThreadPoolExecutor(max_workers=min(8, len(dirs))) as executor:
+		files.extend(chain.from_iterable(executor.map(lambda name: list(iter_files((name,))), dirs)))
+
+	return files
+
 def _pack_callback(name: str, files: List[str]) -> None:
 	pass
 
@@ -964,16 +1788,7 @@ def pack(stream: io.BufferedWriter, files_or_dirs: List[str], mount_point: str,
 	else:
 		raise ValueError('version not supported: %d' % version)
 
-	files: List[str] = []
-	for name in files_or_dirs:
-		if os.path.isdir(name):
-			for dirpath, dirnames, filenames in os.walk(name):
-				for filename in filenames:
-					files.append(os.path.join(dirpath,filename))
-		else:
-			files.append(name)
-
-	files.sort()
+	files = sorted(walk_files(files_or_dirs))
 
 	records: List[Tuple[str, bytes]] = []
 	for filename in files:
@@ -986,26 +1801,38 @@ def pack(stream: io.BufferedWriter, files_or_dirs: List[str], mount_point: str,
 	write_index(stream,version,mount_point,records,encoding)
 
 def write_index(stream: IO[bytes], version: int, mount_point: str, records: List[Tuple[str, bytes]], encoding: str = 'utf-8') -> None:
-	hasher = hashlib.sha1()
+	hasher = new_sha1()
 	index_offset = stream.tell()
 
-	index_header = pack_path(mount_point, encoding) + st_pack('<I',len(records))
-	index_size   = len(index_header)
-	hasher.update(index_header)
-	stream.write(index_header)
+	# The entries are small, so they are appended to one buffer that is hashed
+	# and written every POOL_BUFFER_SIZE bytes. The path is encoded in place,
+	# same as pack_path() but without building the intermediate bytes.
+	index_size = 0
+	pack_u32   = _pack_u32
+	chunk = bytearray(pack_path(mount_point, encoding))
+	chunk += pack_u32(len(records))
 
 	for filename, record in records:
-		encoded_filename = pack_path(filename, encoding)
-		hasher.update(encoded_filename)
-		stream.write(encoded_filename)
-		index_size += len(encoded_filename)
-
-		hasher.update(record)
-		stream.write(record)
-		index_size += len(record)
-
-	index_sha1 = hasher.digest()
-	stream.write(st_pack('<IIQQ20s', 0x5A6F12E1, version, index_offset, index_size, index_sha1))
+		if not SEP_IS_SLASH:
+			filename = filename.replace(os.path.sep, '/')
+		encoded_filename = filename.encode('utf-8')
+		chunk += pack_u32(len(encoded_filename) + 1)
+		chunk += encoded_filename
+		chunk += b'\0'
+		chunk += record
+
+		if len(chunk) >= POOL_BUFFER_SIZE:
+			hasher.update(chunk)
+			stream.write(chunk)
+			index_size += len(chunk)
+			chunk.clear()
+
+	# the footer goes out with the rest of the index, which for most
+	# archives makes the whole index a single write
+	hasher.update(chunk)
+	index_size += len(chunk)
+	chunk += _FOOTER.pack(0x5A6F12E1, version, index_offset, index_size, hasher.digest())
+	stream.write(chunk)
 
 def make_record_v1(filename: str) -> RecordV1:
 	st   = os.stat(filename)
@@ -1052,11 +1879,19 @@ def update(stream: io.BufferedRandom, mount_point: str, insert: Optional[List[st
 	# build directory tree of existing files
 	root = Dir(-1)
 	root.parent = root
-	for record in pak:
-		path = record.filename.split(os.path.sep)
-		path, name = path[:-1], path[-1]
+
+	# Files of the same directory mostly come one after another, so look up
+	# the directory by its path first and only walk (and encode) the path
+	# components the first time it comes up.
+	dirs: Dict[str, Dir] = {}
+	def find_dir(dirpath: str) -> Dir:
+		try:
+			return dirs[dirpath]
+		except KeyError:
+			pass
 
 		parent = root
+		path = dirpath.split(os.path.sep)
 		for i, comp in enumerate(path):
 			comp_encoded = comp.encode(encoding)
 			try:
@@ -1069,10 +1904,17 @@ def update(stream: io.BufferedRandom, mount_point: str, insert: Optional[List[st
 
 			parent = entry
 
+		dirs[dirpath] = parent
+		return parent
+
+	for record in pak:
+		dirpath, sep, name = record.filename.rpartition(os.path.sep)
+		parent = find_dir(dirpath) if sep else root
+
 		if name in parent.children:
 			raise ValueError("doubled name in archive: %s" % record.filename)
 
-		parent.children[name.encode(encoding)] = File(-1, record, parent)
+		parent.children[name.encode(encoding)] = File(-1, record)
 
 	# find files to remove
 	if remove:
@@ -1101,38 +1943,21 @@ def update(stream: io.BufferedRandom, mount_point: str, insert: Optional[List[st
 			entry = parent.children[name_encoded]
 			del parent.children[name_encoded]
 
+		# a removed name might have been a directory
+		dirs.clear()
+
 	# find files to insert
 	if insert:
-		files = []
-		for name in insert:
-			if os.path.isdir(name):
-				for dirpath, dirnames, filenames in os.walk(name):
-					for filename in filenames:
-						files.append(os.path.join(dirpath,filename))
-			else:
-				files.append(name)
+		files = list(iter_files(insert))
 
 		for filename in files:
-			path = filename.split(os.path.sep)
-			path, name = path[:-1], path[-1]
-
-			parent = root
-			for i, comp in enumerate(path):
-				comp_encoded = comp.encode(encoding)
-				try:
-					entry = parent.children[comp_encoded]
-				except KeyError:
-					entry = parent.children[comp_encoded] = Dir(-1, parent=parent)
-
-				if not isinstance(entry, Dir):
-					raise ValueError("name conflict in archive: %r is not a directory" % os.path.join(*path[:i+1]))
-
-				parent = entry
+			dirpath, sep, name = filename.rpartition(os.path.sep)
+			parent = find_dir(dirpath) if sep else root
 
 			if name in parent.children:
 				raise ValueError("doubled name in archive: %s" % filename)
 
-			parent.children[name.encode(encoding)] = File(-1, make_record(filename), parent)
+			parent.children[name.encode(encoding)] = File(-1, make_record(filename))
 
 	# build new allocations
 	existing_records: List[Record] = []
@@ -1144,32 +1969,62 @@ def update(stream: io.BufferedRandom, mount_point: str, insert: Optional[List[st
 		else:
 			existing_records.append(record)
 
+	# The archive can't grow by more than the data and index entries of the
+	# new records. If even that fits the filesystem, the exact size worked
+	# out below doesn't need to be checked against the free space.
+	current_size = os.fstat(stream.fileno()).st_size
+	max_growth = sum(record.alloc_size + record.index_size for record in new_records)
+	free = -1
+	if max_growth > 0 and hasattr(os,'statvfs'):
+		st = os.statvfs(stream.name)
+		free = st.f_frsize * st.f_bfree
+		if free - max_growth >= DEFAULT_BUFFER_SIZE:
+			free = -1
+
 	# try to build new allocations in a way that needs a minimal amount of reads/writes
 	allocations = []
-	new_records.sort(key=lambda r: (r.compressed_size, r.filename),reverse=True)
+	# New records are all uncompressed, so ordering them by alloc_size is the
+	# same as by compressed_size. Holes are filled biggest first, which is
+	# then found by bisecting the sizes instead of scanning the whole list.
+	# Placed records stay in the list (deleting from its middle is O(N)),
+	# they are linked to the next record to their left instead.
+	new_records.sort(key=lambda r: (r.alloc_size, r.filename))
+	new_sizes = [r.alloc_size for r in new_records]
+	unplaced_left = list(range(len(new_records)))
+
+	def find_unplaced(i: int) -> int:
+		# biggest index <= i of a record not placed yet, or -1; halves the
+		# path while following it, so that repeated lookups stay cheap
+		while i >= 0:
+			j = unplaced_left[i]
+			if j == i:
+				return i
+			if j >= 0:
+				unplaced_left[i] = unplaced_left[j]
+			i = unplaced_left[i]
+		return -1
+
 	arch_size = 0
 	for record in existing_records:
 		size = record.alloc_size
 		offset = record.offset
-		if offset > arch_size:
-			# find new records that fit the hole in order to reduce shifts
-			# but never cause a shift torwards the end of the file
-			# this is done so the rewriting/shifting code below is simpler
-			i = 0
-			while i < len(new_records) and arch_size < offset:
-				new_record = new_records[i]
-				new_size = new_record.alloc_size
-				if arch_size + new_size <= offset:
-					allocations.append((arch_size, new_record))
-					del new_records[i]
-					arch_size += new_size
-				else:
-					i += 1
+		# find new records that fit the hole in order to reduce shifts
+		# but never cause a shift torwards the end of the file
+		# this is done so the rewriting/shifting code below is simpler
+		while arch_size < offset:
+			i = find_unplaced(bisect_right(new_sizes, offset - arch_size) - 1)
+			if i < 0:
+				break
+			unplaced_left[i] = i - 1
+			new_record = new_records[i]
+			allocations.append((arch_size, new_record))
+			arch_size += new_record.alloc_size
 
 		allocations.append((arch_size, record))
 		arch_size += size
 
 	# add remaining records at the end
+	new_records = [record for i, record in enumerate(new_records) if unplaced_left[i] == i]
 	new_records.sort(key=lambda r: r.filename)
 	for record in new_records:
 		allocations.append((arch_size,record))
@@ -1182,63 +2037,179 @@ def update(stream: io.BufferedRandom, mount_point: str, insert: Optional[List[st
 	footer_offset = arch_size
 	arch_size += 44
 
-	current_size = os.fstat(stream.fileno()).st_size
 	diff_size = arch_size - current_size
 	# minimize chance of corrupting archive
-	if diff_size > 0 and hasattr(os,'statvfs'):
-		st = os.statvfs(stream.name)
-		free = st.f_frsize * st.f_bfree
-		if free - diff_size < DEFAULT_BUFFER_SIZE:
-			raise ValueError("filesystem not big enough")
+	if diff_size > 0 and free >= 0 and free - diff_size < DEFAULT_BUFFER_SIZE:
+		raise ValueError("filesystem not big enough")
 
-	index_records = []
+	index_records: List[Tuple[str, bytes]] = []
+	new_allocations: List[Tuple[int, int, Record]] = []
 	for offset, record in reversed(allocations):
 		if record.offset == -1:
-			# new record
-			filename = record.filename
-			callback("+" + filename)
-			fh: io.BufferedReader
-			with open(filename, "rb") as fh: # type: ignore
-				record_bytes = write_record(stream, fh, record.compression_method, record.encrypted, record.compression_block_size or 0)
-		elif offset != record.offset:
+			# new record, written below once everything is shifted
+			new_allocations.append((len(index_records), offset, record))
+			index_records.append((record.filename, b''))
+			continue
+
+		if offset != record.offset:
 			assert offset > record.offset
-			callback(" "+filename)
+			callback(" " + record.filename)
 			fshift(stream, record.offset, offset, record.alloc_size)
-			stream.seek(offset, 0)
-			record_bytes = stream.read(record.header_size)
-		index_records.append((filename, record_bytes))
+		# the header in front of the data doesn't hold the offset of the record
+		stream.seek(offset, 0)
+		header = stream.read(record.header_size)
+		index_records.append((record.filename, _U64.pack(offset) + header[_U64.size:]))
+
+	# Shifting back to front means whatever a record is moved over was moved
+	# out of the way before, so after all shifts a new record only ever lands
+	# on space no existing record uses anymore. The new records don't overlap
+	# each other either, so they are written in parallel, each through its
+	# own file object. The copies are I/O bound and release the GIL.
+	if new_allocations:
+		stream.flush()
+		archive_name = stream.name
+
+		def write_new_record(offset: int, record: Record) -> bytes:
+			archive: io.BufferedRandom
+			fh: io.BufferedReader
+			with open(archive_name, "r+b") as archive, open(record.filename, "rb") as fh: # type: ignore
+				archive.seek(offset, 0)
+				return write_record(archive, fh, record.compression_method, record.encrypted, record.compression_block_size or 0)
+
+		with ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1)) as executor:
+			futures = {
+				executor.submit(write_new_record, offset, record): (index, record)
+				for index, offset, record in new_allocations
+			}
+			try:
+				for future in as_completed(futures):
+					index, record = futures[future]
+					callback("+" + record.filename)
+					index_records[index] = (record.filename, future.result())
+			finally:
+				for future in futures:
+					future.cancel()
 
+	stream.seek(index_offset, 0)
 	write_index(stream,pak.version,mount_point,index_records,encoding)
 
 	if diff_size < 0:
 		stream.truncate(arch_size)
 
+def fshift_kernel(fd: int, src: int, dst: int, size: int) -> int:
+	"""
+	Move the range back to front with copy_file_range(2), so the data never
+	leaves the kernel. The same file may only be copied between ranges that
+	don't overlap, so no chunk is bigger than the shift distance. Returns how
+	many bytes at the start of the range are left to the caller, which is
+	not 0 if the kernel or filesystem refuses.
+	"""
+	while size > 0:
+		count = min(size, dst - src, SENDFILE_MAX_SIZE)
+		start = size - count
+		done  = 0
+		while done < count:
+			try:
+				n = os.copy_file_range(fd, fd, count - done, src + start + done, dst + start + done)
+			except OSError:
+				n = 0
+			if n == 0:
+				# the source of this chunk is still intact, redo all of it
+				return size
+			done += n
+		size = start
+	return 0
+
 def fshift(stream: io.BufferedRandom, src: int, dst: int, size: int) -> None:
 	assert src < dst
-	buf_size = DEFAULT_BUFFER_SIZE
-	buf      = bytearray(buf_size)
+	if HAS_COPY_FILE_RANGE and size > 0 and dst - src >= DEFAULT_BUFFER_SIZE:
+		try:
+			fd = stream.fileno()
+		except (AttributeError, io.UnsupportedOperation):
+			fd = -1
 
-	while size > 0:
-		data: Union[bytes, bytearray]
-		if size >= buf_size:
-			stream.seek(src + size - buf_size, 0)
-			stream.readinto(buf)
-			data = buf
-			size -= buf_size
-		else:
-			stream.seek(src, 0)
-			data = stream.read(size) or b''
-			size = 0
+		if fd >= 0:
+			stream.flush()
+			try:
+				size = fshift_kernel(fd, src, dst, size)
+			finally:
+				# seeking to the end drops whatever stream has buffered of the
+				# range that was just changed behind its back
+				stream.seek(0, 2)
+
+	with pooled_buffer() as buf:
+		buf_size = len(buf)
+		while size > 0:
+			data: Union[bytes, bytearray]
+			if size >= buf_size:
+				stream.seek(src + size - buf_size, 0)
+				stream.readinto(buf)
+				data = buf
+				size -= buf_size
+			else:
+				stream.seek(src, 0)
+				data = stream.read(size) or b''
+				size = 0
 
-		stream.seek(dst + size, 0)
-		stream.write(data)
+			# This walks the file backwards, which readahead doesn't pick up,
+			# so ask for the next chunk while this one is written.
+			if size > 0:
+				next_start = max(src, src + size - buf_size)
+				fadvise(stream, POSIX_FADV_WILLNEED, next_start, src + size - next_start)
+
+			stream.seek(dst + size, 0)
+			stream.write(data)
+
+# amount of compressed data unpacked per task when unpacking in parallel
+UNPACK_BATCH_SIZE = 32 << 20
+
+def batch_records(records: Iterable[Record], batch_size: int = UNPACK_BATCH_SIZE) -> List[List[Record]]:
+	batches: List[List[Record]] = []
+	batch: List[Record] = []
+	batch_bytes = 0
+	for record in records:
+		batch.append(record)
+		batch_bytes += record.compressed_size
+		if batch_bytes >= batch_size:
+			batches.append(batch)
+			batch = []
+			batch_bytes = 0
+
+	if batch:
+		batches.append(batch)
+
+	return batches
+
+def map_batches(func: Callable[[List[Record]], List[Record]], batches: List[List[Record]], max_workers: Optional[int] = None) -> Iterator[List[Record]]:
+	"""
+	Call func for every batch on a thread pool and yield the results in the
+	order they are finished. zlib, sendfile, write and SHA-1 all release the
+	GIL, so as long as func only reads the archive through a mapping (or
+	through pread like calls) this scales with the number of cores. If func
+	raises, the batches not started yet are cancelled and the error is
+	raised here.
+	"""
+	with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count() or 1) as executor:
+		futures = [executor.submit(func, batch) for batch in batches]
+		try:
+			for future in as_completed(futures):
+				yield future.result()
+		finally:
+			for future in futures:
+				future.cancel()
 
 def shall_unpack(paths: Iterable[str], name: str) -> bool:
-	path = name.split(os.path.sep)
-	for i in range(1, len(path) + 1):
-		prefix = os.path.join(*path[0:i])
-		if prefix in paths:
+	# name itself or one of the directories it is in, sliced out of name at
+	# the separators instead of joining the split path again for every prefix
+	if name in paths:
+		return True
+
+	sep = os.path.sep
+	end = name.find(sep)
+	while end != -1:
+		if name[:end] in paths:
 			return True
+		end = name.find(sep, end + 1)
 	return False
 
 def human_size(size: int) -> str:
@@ -1292,83 +2263,98 @@ SORT_ALIASES: Dict[str, str] = {
 	"n": "name"
 }
 
-KEY_FUNCS: Dict[str, Callable[[Record], Union[str, int]]] = {
-	"size":  lambda rec: rec.uncompressed_size,
-	"-size": lambda rec: -rec.uncompressed_size,
+# sort keys as Python expressions over a record named rec
+KEY_EXPRS: Dict[str, str] = {
+	"size":  "rec.uncompressed_size",
+	"-size": "-rec.uncompressed_size",
 
-	"zsize":  lambda rec: rec.compressed_size,
-	"-zsize": lambda rec: -rec.compressed_size,
+	"zsize":  "rec.compressed_size",
+	"-zsize": "-rec.compressed_size",
 
-	"offset":  lambda rec: rec.offset,
-	"-offset": lambda rec: -rec.offset,
+	"offset":  "rec.offset",
+	"-offset": "-rec.offset",
 
-	"name": lambda rec: rec.filename.lower(),
+	"name": "rec.filename.lower()",
+}
+
+KEY_FUNCS: Dict[str, Callable[[Record], Union[str, int]]] = {
+	key: eval("lambda rec: " + expr, {}) for key, expr in KEY_EXPRS.items()
 }
 
 def sort_key_func(sort: str) -> Callable[[Record], Tuple[Union[str, int], ...]]:
-	key_funcs = []
+	exprs = []
 	for key in sort.split(","):
 		key = SORT_ALIASES.get(key,key)
 		try:
-			func = KEY_FUNCS[key]
+			expr = KEY_EXPRS[key]
 		except KeyError:
 			raise ValueError("unknown sort key: "+key)
-		key_funcs.append(func)
+		exprs.append(expr)
 
-	return lambda rec: tuple(key_func(rec) for key_func in key_funcs)
+	# The key is called for every record, so compile all fields into one
+	# function instead of calling a function per field from a generator.
+	# Only the fixed expressions from KEY_EXPRS end up in the code.
+	return eval("lambda rec: (%s,)" % ", ".join(exprs), {})
 
 class Entry(object):
-	__slots__ = 'inode', '_parent', 'stat', '__weakref__'
+	__slots__ = 'inode', 'stat'
 
 	inode: int
-	_parent: Optional[weakref.ref[Dir]]
 	stat: Optional[os.stat_result]
 
-	def __init__(self, inode: int, parent: Optional[Dir] = None) -> None:
+	def __init__(self, inode: int) -> None:
 		self.inode  = inode
-		self.parent = parent
 		self.stat   = None
 
 	@property
 	def parent(self) -> Optional[Dir]:
-		return self._parent() if self._parent is not None else None
-
-	@parent.setter
-	def parent(self, parent: Optional[Dir]) -> None:
-		self._parent = weakref.ref(parent) if parent is not None else None
+		# Only directories remember their parent (for '..'). Files are the
+		# bulk of the tree and so don't carry a reference each.
+		return None
 
 class Dir(Entry):
-	__slots__ = 'children',
+	# A plain reference, the tree is kept alive as a whole anyway (by the
+	# inode table of Operations or the caller) and the cycles through the
+	# parents are no leak, so there is no need for a weakref per directory.
+	__slots__ = 'children', 'parent'
 
-	children: OrderedDict[bytes, Union[Dir, File]]
+	children: Dict[bytes, Union[Dir, File]]
+	parent: Optional[Dir] # type: ignore
 
-	def __init__(self, inode: int, children: Optional[OrderedDict[bytes, Union[Dir, File]]] = None, parent: Optional[Dir] = None) -> None:
-		Entry.__init__(self,inode,parent)
+	def __init__(self, inode: int, children: Optional[Dict[bytes, Union[Dir, File]]] = None, parent: Optional[Dir] = None) -> None:
+		Entry.__init__(self,inode)
+		self.parent = parent
 		if children is None:
-			self.children = OrderedDict()
+			self.children = {}
 		else:
 			self.children = children
 			for child in children.values():
-				child.parent = self
+				if isinstance(child, Dir):
+					child.parent = self
 
 	def __repr__(self) -> str:
 		return 'Dir(%r, %r)' % (self.inode, self.children)
 
-	def allrecords(self) -> Iterable[Record]:
-		for child in self.children.values():
-			if isinstance(child, Dir):
-				for record in child.allrecords():
-					yield record
-			else:
+	def allrecords(self) -> Iterator[Record]:
+		# same order as recursing into every Dir, but with one generator and a
+		# stack of iterators instead of a generator per directory level
+		stack = [iter(self.children.values())]
+		while stack:
+			for child in stack[-1]:
+				if isinstance(child, Dir):
+					stack.append(iter(child.children.values()))
+					break
 				yield child.record
+			else:
+				stack.pop()
 
 class File(Entry):
 	__slots__ = 'record',
 
 	record: Record
 
-	def __init__(self, inode: int, record: Record, parent: Optional[Dir] = None) -> None:
-		Entry.__init__(self, inode, parent)
+	def __init__(self, inode: int, record: Record) -> None:
+		Entry.__init__(self, inode)
 		self.record = record
 
 	def __repr__(self) -> str:
@@ -1376,7 +2362,6 @@ class File(Entry):
 
 if HAS_LLFUSE:
 	import errno
-	# import weakref (already imported)
 	# import stat (already imported)
 	# import mmap (already imported)
 
@@ -1384,21 +2369,30 @@ if HAS_LLFUSE:
 	DIR_PARENT = '..'.encode(sys.getfilesystemencoding())
 
 	class Operations(llfuse.Operations):
-		__slots__ = 'archive', 'root', 'inodes', 'arch_st', 'data'
+		__slots__ = 'archive', 'root', 'inodes', 'arch_st', 'arch_attrs', 'data', 'listings', 'block_cache'
 
 		archive: io.BufferedReader
 		inodes: Dict[int, Union[Dir, File]]
 		root: Dir
 		arch_st: os.stat_result
+		arch_attrs: Tuple[int, int, int, int, int, int]
 		data: mmap.mmap
 
 		def __init__(self, archive: io.BufferedReader, pak: Pak) -> None:
 			llfuse.Operations.__init__(self)
 			self.archive = archive
-			self.arch_st = os.fstat(archive.fileno())
+			self.arch_st = arch_st = os.fstat(archive.fileno())
+			# owner, block size and times of every entry are the ones of the archive
+			if HAS_STAT_NS:
+				times = (arch_st.st_atime_ns, arch_st.st_mtime_ns, arch_st.st_ctime_ns)
+			else:
+				times = (int(arch_st.st_atime * 1000), int(arch_st.st_mtime * 1000), int(arch_st.st_ctime * 1000))
+			self.arch_attrs = (arch_st.st_uid, arch_st.st_gid, arch_st.st_blksize) + times
 			self.root    = Dir(llfuse.ROOT_INODE)
 			self.inodes  = {self.root.inode: self.root}
 			self.root.parent = self.root
+			# names of directories listed in more than one go, by inode
+			self.listings: Dict[int, List[bytes]] = {}
 
 			encoding = sys.getfilesystemencoding()
 			inode = self.root.inode + 1
@@ -1428,16 +2422,16 @@ if HAS_LLFUSE:
 					i += 1
 					enc_name = ("%s~%d%s" % (name, i, ext)).encode(encoding)
 
-				parent.children[enc_name] = self.inodes[inode] = File(inode, record, parent)
+				parent.children[enc_name] = self.inodes[inode] = File(inode, record)
 				inode += 1
 
 			archive.seek(0, 0)
 			self.data = mmap.mmap(archive.fileno(), 0, access=mmap.ACCESS_READ)
-
-			# cache entry attributes
-			for inode in self.inodes:
-				entry = self.inodes[inode]
-				entry.stat = self._getattr(entry)
+			# Reads jump between whatever files are in use, so no readahead.
+			# open() asks for the whole record instead (prefetch_record()).
+			madvise(self.data, MADV_RANDOM)
+			# llfuse calls the handlers with its global lock held, one at a time
+			self.block_cache = BlockCache()
 
 		def destroy(self) -> None:
 			self.data.close()
@@ -1463,9 +2457,15 @@ if HAS_LLFUSE:
 			except KeyError:
 				raise llfuse.FUSEError(errno.ENOENT)
 			else:
-				stat = entry.stat
-				assert stat is not None
-				return stat
+				return self._stat(entry)
+
+		def _stat(self, entry: Union[Dir, File]) -> llfuse.EntryAttributes:
+			# Attributes are built and cached the first time the kernel asks
+			# for them, instead of for every entry while mounting.
+			stat = entry.stat
+			if stat is None:
+				stat = entry.stat = self._getattr(entry)
+			return stat
 
 		def _getattr(self, entry: Union[Dir, File]) -> llfuse.EntryAttributes:
 			attrs = llfuse.EntryAttributes()
@@ -1477,35 +2477,29 @@ if HAS_LLFUSE:
 			attrs.attr_timeout  = 300
 
 			if isinstance(entry, Dir):
+				children = entry.children
 				nlink = 2 if entry is not self.root else 1
-				size  = 5
-
-				for name, child in entry.children.items():
-					size += len(name) + 1
-					if type(child) is Dir:
-						nlink += 1
+				# counted in C: a byte per name plus its separator, and a link per subdirectory
+				size  = 5 + sum(map(len, children)) + len(children)
+				nlink += sum([type(child) is Dir for child in children.values()])
 
 				attrs.st_mode  = stat.S_IFDIR | 0o555
 				attrs.st_nlink = nlink
 				attrs.st_size  = size
 			else:
+				size = entry.record.uncompressed_size
 				attrs.st_nlink = 1
 				attrs.st_mode  = stat.S_IFREG | 0o444
-				attrs.st_size  = entry.record.uncompressed_size
+				attrs.st_size  = size
 
-			arch_st = self.arch_st
-			attrs.st_uid     = arch_st.st_uid
-			attrs.st_gid     = arch_st.st_gid
-			attrs.st_blksize = arch_st.st_blksize
-			attrs.st_blocks  = 1 + ((attrs.st_size - 1) // attrs.st_blksize) if attrs.st_size != 0 else 0
-			if HAS_STAT_NS:
-				attrs.st_atime_ns = arch_st.st_atime_ns
-				attrs.st_mtime_ns = arch_st.st_mtime_ns
-				attrs.st_ctime_ns = arch_st.st_ctime_ns
-			else:
-				attrs.st_atime_ns = int(arch_st.st_atime * 1000)
-				attrs.st_mtime_ns = int(arch_st.st_mtime * 1000)
-				attrs.st_ctime_ns = int(arch_st.st_ctime * 1000)
+			uid, gid, blksize, atime_ns, mtime_ns, ctime_ns = self.arch_attrs
+			attrs.st_uid      = uid
+			attrs.st_gid      = gid
+			attrs.st_blksize  = blksize
+			attrs.st_blocks   = 1 + ((size - 1) // blksize) if size != 0 else 0
+			attrs.st_atime_ns = atime_ns
+			attrs.st_mtime_ns = mtime_ns
+			attrs.st_ctime_ns = ctime_ns
 
 			return attrs
 
@@ -1515,9 +2509,7 @@ if HAS_LLFUSE:
 			except KeyError:
 				raise llfuse.FUSEError(errno.ENOENT)
 			else:
-				stat = entry.stat
-				assert stat is not None
-				return stat
+				return self._stat(entry)
 
 		def getxattr(self, inode: int, name: bytes, ctx) -> bytes:
 			try:
@@ -1589,15 +2581,25 @@ if HAS_LLFUSE:
 				if not isinstance(entry, Dir):
 					raise llfuse.FUSEError(errno.ENOTDIR)
 
-				names = list(entry.children)[offset:] if offset > 0 else entry.children
-				for name in names:
-					child = entry.children[name]
-					stat = child.stat
-					assert stat is not None
-					yield name, stat, child.inode
+				# The offset is the position to continue at. Big directories are
+				# listed in several calls, for which the names are put in a list
+				# once instead of copying all of them on every call.
+				children = entry.children
+				if offset == 0:
+					for index, (name, child) in enumerate(children.items(), 1):
+						yield name, self._stat(child), index
+				else:
+					names = self.listings.get(inode)
+					if names is None:
+						names = self.listings[inode] = list(children)
+					for index in range(offset, len(names)):
+						name = names[index]
+						yield name, self._stat(children[name]), index + 1
 
 		def releasedir(self, fh: int) -> None:
-			pass
+			# fh is the inode (see opendir()). Another open handle of the same
+			# directory just builds its name list again if it still needs it.
+			self.listings.pop(fh, None)
 
 		def statfs(self, ctx) -> os.stat_result:
 			attrs = llfuse.StatvfsData()
@@ -1627,6 +2629,9 @@ if HAS_LLFUSE:
 				if flags & 3 != os.O_RDONLY:
 					raise llfuse.FUSEError(errno.EACCES)
 
+				# opened files are mostly read as a whole, start fetching them now
+				prefetch_record(self.data, entry.record)
+
 				return inode
 
 		def read(self, fh: int, offset: int, length: int) -> bytes:
@@ -1639,7 +2644,7 @@ if HAS_LLFUSE:
 				raise llfuse.FUSEError(errno.EISDIR)
 
 			try:
-				return entry.record.read(self.data, offset, length)
+				return entry.record.read(self.data, offset, length, self.block_cache)
 			except NotImplementedError:
 				raise llfuse.FUSEError(errno.ENOSYS)
 
@@ -1696,6 +2701,187 @@ def deamonize(stdout: str = '/dev/null', stderr: Optional[str] = None, stdin: st
 # == KODE GUI (PySide6) ==
 # ==============================================================================
 
+class PakTreeDir(object):
+    """
+    Satu folder di tree view. Isi children adalah PakTreeDir (subfolder) atau
+    int (nomor baris record di PakIndex).
+    """
+    __slots__ = 'name', 'parent', 'row', 'children'
+
+    def __init__(self, name, parent=None, row=0):
+        self.name = name
+        self.parent = parent
+        self.row = row # posisi folder ini di parent.children
+        self.children = []
+
+class PakTreeModel(QAbstractItemModel):
+    """
+    Model read-only untuk konten .pak yang membaca langsung dari kolom PakIndex.
+    Tidak ada QStandardItem; teks sel baru dibuat saat view memintanya.
+    """
+    HEADERS = ['Filename', 'Size', 'Compressed Size', 'Compression', 'SHA1']
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pak_index = PakIndex([])
+        self.root = PakTreeDir('')
+        self.basenames = []
+        self.sort_column = 0
+        self.sort_order = Qt.AscendingOrder
+
+    def set_index(self, pak_index):
+        """Mengganti isi model dengan PakIndex baru."""
+        self.beginResetModel()
+        self.pak_index = pak_index
+        self.root = PakTreeDir('')
+        self.basenames = []
+
+        # Kumpulkan baris per folder; path_map berisi folder yang sudah dibuat.
+        # Nama di Record sudah memakai separator OS (lihat read_index), jadi
+        # bukan '/' tetap; cukup diambil sekali di luar loop.
+        path_map = {'': self.root}
+        basenames = self.basenames
+        sep = os.path.sep
+        for row, filename in enumerate(pak_index.names):
+            dir_path, _, basename = filename.rpartition(sep)
+            basenames.append(basename)
+            node = path_map.get(dir_path)
+            if node is None:
+                node = self._make_dir(path_map, dir_path)
+            node.children.append(row)
+
+        self._sort_dir(self.root, self._sort_key(self.sort_column), self.sort_order == Qt.DescendingOrder)
+        self.endResetModel()
+
+    def clear(self):
+        self.set_index(PakIndex([]))
+
+    def _make_dir(self, path_map, dir_path):
+        parent_path, _, name = dir_path.rpartition(os.path.sep)
+        parent = path_map.get(parent_path)
+        if parent is None:
+            parent = self._make_dir(path_map, parent_path)
+        node = PakTreeDir(name, parent, len(parent.children))
+        parent.children.append(node)
+        path_map[dir_path] = node
+        return node
+
+    def _node(self, index):
+        """Folder (PakTreeDir) atau nomor baris record untuk index."""
+        if not index.isValid():
+            return self.root
+        return index.internalPointer().children[index.row()]
+
+    def index(self, row, column, parent=QModelIndex()):
+        if not self.hasIndex(row, column, parent):
+            return QModelIndex()
+        # internalPointer selalu folder induk dari item tersebut
+        return self.createIndex(row, column, self._node(parent))
+
+    def parent(self, index=QModelIndex()):
+        if not index.isValid():
+            return QModelIndex()
+        node = index.internalPointer()
+        if node is self.root:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node.parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        node = self._node(parent)
+        if type(node) is int:
+            return 0
+        return len(node.children)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer().children[index.row()]
+        column = index.column()
+
+        if type(node) is not int:
+            if role == Qt.DisplayRole and column == 0:
+                return node.name
+            return None
+
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return self.basenames[node]
+            elif column == 1:
+                return human_size(self.pak_index.sizes[node])
+            elif column == 2:
+                return human_size(self.pak_index.csizes[node])
+            elif column == 3:
+                return COMPR_METHOD_NAMES.get(self.pak_index.methods[node], 'unknown')
+            elif column == 4:
+                return self.pak_index.sha1_hex(node)
+        elif role == Qt.UserRole and column == 0:
+            return self.pak_index.names[node] # path lengkap di dalam .pak
+        return None
+
+    def _sort_key(self, column):
+        """Fungsi key untuk children sebuah folder menurut kolom tertentu."""
+        if column == 0:
+            basenames = self.basenames
+            return lambda node: basenames[node] if type(node) is int else node.name
+
+        pak_index = self.pak_index
+        if column == 1:
+            column_values = pak_index.sizes
+        elif column == 2:
+            column_values = pak_index.csizes
+        elif column == 3:
+            column_values = [COMPR_METHOD_NAMES.get(method, 'unknown') for method in pak_index.methods]
+        else:
+            sha1 = pak_index.sha1
+            column_values = [sha1[row * 20:row * 20 + 20] for row in range(len(pak_index))]
+
+        # Urutkan seluruh kolom sekali, lalu pakai peringkatnya di tiap folder
+        rank = array('q', bytes(8 * len(pak_index)))
+        for position, row in enumerate(pak_index.argsort(column_values)):
+            rank[row] = position
+        # Folder tidak punya nilai selain nama, jadi dikelompokkan di depan
+        return lambda node: (1, rank[node], '') if type(node) is int else (0, 0, node.name)
+
+    def _sort_dir(self, node, key, reverse):
+        node.children.sort(key=key, reverse=reverse)
+        for row, child in enumerate(node.children):
+            if type(child) is not int:
+                child.row = row
+                self._sort_dir(child, key, reverse)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.sort_column = column
+        self.sort_order = order
+        self.layoutAboutToBeChanged.emit()
+
+        # Ingat item di balik setiap persistent index (mis. seleksi) sebelum diurutkan
+        old_indexes = self.persistentIndexList()
+        items = [(index.internalPointer(), index.internalPointer().children[index.row()], index.column())
+                 for index in old_indexes]
+
+        self._sort_dir(self.root, self._sort_key(column), order == Qt.DescendingOrder)
+
+        positions = {}
+        new_indexes = []
+        for parent, child, column in items:
+            parent_positions = positions.get(parent)
+            if parent_positions is None:
+                parent_positions = positions[parent] = {item: row for row, item in enumerate(parent.children)}
+            new_indexes.append(self.createIndex(parent_positions[child], column, parent))
+        self.changePersistentIndexList(old_indexes, new_indexes)
+
+        self.layoutChanged.emit()
+
 class Worker(QObject):
     """
     Worker untuk menjalankan tugas berat di thread terpisah agar GUI tidak macet.
@@ -1706,17 +2892,45 @@ class Worker(QObject):
     error = Signal(str)
     pak_loaded = Signal(object)
     info_ready = Signal(str)
-    test_results = Signal(list)
+    test_results = Signal(int) # jumlah error
+    error_found = Signal(str)
+
+    # Jarak minimal (detik) antar pemancaran log/progress per file, agar
+    # arsip dengan puluhan ribu file kecil tidak membanjiri event loop GUI
+    EMIT_INTERVAL = 0.05
 
     def __init__(self):
         super().__init__()
         self.pak_file = None
         self.pak_obj = None
+        # (ukuran, mtime, inode) file .pak saat pak_obj dimuat
+        self.pak_stat = None
+        self._log_lines = []
+        self._last_emit = 0.0
+
+    def _log_and_progress(self, current_task, total_tasks, message):
+        """
+        Mencatat satu baris log beserta progress-nya. Baris-baris dikumpulkan
+        dan dipancarkan sekaligus paling sering tiap EMIT_INTERVAL, dan selalu
+        saat tugas terakhir selesai.
+        """
+        self._log_lines.append(message)
+        now = time.monotonic()
+        if current_task >= total_tasks or now - self._last_emit >= self.EMIT_INTERVAL:
+            self._last_emit = now
+            self._flush_log()
+            self.progress.emit(current_task, total_tasks)
+
+    def _flush_log(self):
+        """Memancarkan baris log yang masih tertahan."""
+        if self._log_lines:
+            self.log.emit("\n".join(self._log_lines))
+            self._log_lines.clear()
 
-    def _log_and_progress(self, current_task, total_tasks, current_file):
-        """Helper untuk memancarkan sinyal log dan progress."""
-        self.progress.emit(current_task, total_tasks)
-        self.log.emit(f"[{current_task}/{total_tasks}] Processing: {current_file}")
+    @staticmethod
+    def _file_identity(st):
+        """Ciri file dari os.stat() untuk mengenali bila file-nya berubah."""
+        return st.st_size, st.st_mtime_ns, st.st_ino
 
     @staticmethod
     def _collect_files(paths: List[str]) -> List[str]:
@@ -1724,22 +2938,29 @@ class Worker(QObject):
         all_files = []
         for path in paths:
             if os.path.isdir(path):
-                for dirpath, _, filenames in os.walk(path):
-                    for filename in filenames:
-                        full_path = os.path.join(dirpath, filename)
-                        # Buat path relatif terhadap direktori input
-                        rel_path = os.path.relpath(full_path, os.path.dirname(path))
-                        all_files.append((full_path, rel_path))
+                for full_path in iter_files([path]):
+                    # Buat path relatif terhadap direktori input
+                    rel_path = os.path.relpath(full_path, os.path.dirname(path))
+                    all_files.append((full_path, rel_path))
             elif os.path.isfile(path):
                 all_files.append((path, os.path.basename(path)))
         return all_files
 
+    @Slot(str)
     def load_pak(self, pak_file, check_integrity=False, ignore_nulls=False):
         """Memuat file .pak dan memancarkan objek pak."""
         self.pak_file = pak_file
+        # Jangan sampai indeks arsip sebelumnya tetap dipakai bila gagal dimuat
+        self.pak_obj = None
+        self.pak_stat = None
         try:
-            with open(self.pak_file, "rb") as stream:
+            with open(self.pak_file, "rb", buffering=STREAM_BUFFER_SIZE) as stream:
+                pak_stat = self._file_identity(os.fstat(stream.fileno()))
                 self.pak_obj = read_index(stream, check_integrity, ignore_null_checksums=ignore_nulls)
+                # Kolom PakIndex untuk tree view dibangun di thread ini, Pak
+                # menyimpannya sehingga on_pak_loaded tinggal memakainya
+                self.pak_obj.index()
+                self.pak_stat = pak_stat
                 self.log.emit(f"Successfully loaded '{os.path.basename(pak_file)}'. Found {len(self.pak_obj.records)} files.")
                 self.pak_loaded.emit(self.pak_obj)
         except Exception as e:
@@ -1747,6 +2968,7 @@ class Worker(QObject):
         finally:
             self.finished.emit()
 
+    @Slot(bool)
     def get_info(self, human_readable=False):
         """Mendapatkan informasi arsip dan menyiapkannya untuk ditampilkan."""
         if not self.pak_obj:
@@ -1763,7 +2985,8 @@ class Worker(QObject):
         finally:
             self.finished.emit()
 
-    def unpack_files(self, out_dir, selected_files=None):
+    @Slot(str, object, bool)
+    def unpack_files(self, out_dir, selected_files=None, skip_unpacked=False):
         """Mengekstrak file (semua atau yang dipilih)."""
         if not self.pak_obj or not self.pak_file:
             self.error.emit("No .pak file loaded.")
@@ -1779,34 +3002,66 @@ class Worker(QObject):
             
             total_files = len(files_to_unpack)
             
-            with open(self.pak_file, "rb") as stream:
-                for i, record in enumerate(files_to_unpack):
-                    self.progress.emit(i + 1, total_files)
-                    self.log.emit(f"Unpacking [{i+1}/{total_files}]: {record.filename}")
-                    record.unpack(stream, out_dir)
+            with open(self.pak_file, "rb", buffering=STREAM_BUFFER_SIZE) as stream:
+                data = map_archive(stream, None)
+                # Folder yang sudah dibuat selama unpack ini
+                created_dirs = set()
+                if data is None:
+                    # Tanpa mmap setiap batch membuka arsipnya sendiri
+                    self._unpack_parallel(None, None, files_to_unpack, out_dir, created_dirs, skip_unpacked)
+                else:
+                    try:
+                        advise_unpack(data, files_to_unpack)
+                        self._unpack_parallel(stream, data, files_to_unpack, out_dir, created_dirs, skip_unpacked)
+                    finally:
+                        data.close()
 
             self.log.emit(f"Unpack finished successfully. {total_files} file(s) extracted.")
         except Exception as e:
+            self._flush_log()
             self.error.emit(f"Unpacking failed:\n{traceback.format_exc()}")
         finally:
             self.finished.emit()
             
+    def _unpack_parallel(self, stream, data, records, out_dir, created_dirs, skip_unpacked):
+        """
+        Mengekstrak record memakai beberapa thread. zlib, sendfile, dan write
+        melepas GIL, dan mmap hanya dibaca, jadi tidak perlu sinkronisasi.
+        Tanpa mmap (data None) posisi seek tidak bisa dibagi antar thread,
+        jadi setiap batch membaca lewat file handle miliknya sendiri.
+        """
+        total_files = len(records)
+        done = 0
+
+        def unpack_batch(batch):
+            if data is None:
+                with open(self.pak_file, "rb", buffering=STREAM_BUFFER_SIZE) as batch_stream:
+                    # Satu batch dibatasi UNPACK_BATCH_SIZE, jadi seluruh isinya
+                    # bisa diminta dibaca kernel sementara record pertama diekstrak
+                    fadvise(batch_stream, POSIX_FADV_SEQUENTIAL)
+                    prefetch_stream_records(batch_stream, batch)
+                    for record in batch:
+                        record.unpack(batch_stream, out_dir, created_dirs=created_dirs, skip_unpacked=skip_unpacked)
+            else:
+                for record in batch:
+                    record.unpack(stream, out_dir, data=data, created_dirs=created_dirs, skip_unpacked=skip_unpacked)
+            return batch
+
+        for batch in map_batches(unpack_batch, batch_records(records)):
+            for record in batch:
+                done += 1
+                self._log_and_progress(done, total_files, f"Unpacked [{done}/{total_files}]: {record.filename}")
+
+    @Slot(object, str, str, int, bool)
     def pack_files(self, files_to_pack, output_pak, mount_point, version, use_zlib):
         """Membuat arsip .pak dari file/folder."""
         try:
             self.log.emit(f"Starting to pack files into '{output_pak}'...")
 
-            all_files = []
-            for item_path in files_to_pack:
-                if os.path.isdir(item_path):
-                    for dirpath, _, filenames in os.walk(item_path):
-                        for filename in filenames:
-                            all_files.append(os.path.join(dirpath, filename))
-                else:
-                    all_files.append(item_path)
-
-            total_files = len(all_files)
-            if total_files == 0:
+            # Pohon direktori cukup dibaca sekali oleh pack(), di sini hanya
+            # dicek apakah ada file sama sekali (berhenti di file pertama).
+            # Total untuk progress datang dari daftar yang diberikan pack().
+            if next(iter_files(files_to_pack), None) is None:
                 self.error.emit("No files found to pack.")
                 self.finished.emit()
                 return
@@ -1816,54 +3071,92 @@ class Worker(QObject):
             def pack_progress_callback(name, files_list):
                 nonlocal processed_count
                 processed_count += 1
-                self.progress.emit(processed_count, len(files_list))
-                self.log.emit(f"Packing [{processed_count}/{len(files_list)}]: {name}")
+                self._log_and_progress(processed_count, len(files_list),
+                                       f"Packing [{processed_count}/{len(files_list)}]: {name}")
 
             comp_method = COMPR_ZLIB if use_zlib else COMPR_NONE
             
-            with open(output_pak, "wb") as wstream:
+            with open(output_pak, "wb", buffering=STREAM_BUFFER_SIZE) as wstream:
                 pack(wstream, files_to_pack, mount_point, version, comp_method,
                      callback=pack_progress_callback)
 
             self.log.emit(f"Packing finished successfully. Created '{output_pak}'.")
         except Exception as e:
+            self._flush_log()
             self.error.emit(f"Packing failed:\n{traceback.format_exc()}")
         finally:
             self.finished.emit()
 
-    def test_integrity(self, ignore_nulls=False):
+    @Slot(str, bool)
+    def test_integrity(self, pak_file, ignore_nulls=False):
         """Menjalankan pemeriksaan integritas pada file .pak."""
-        if not self.pak_obj or not self.pak_file:
-            self.error.emit("No .pak file loaded.")
-            self.finished.emit()
-            return
-            
         try:
             self.log.emit("Starting integrity test...")
-            errors = []
+            error_count = 0
+            pending_errors = []
+            last_emit = 0.0
+
+            def flush_errors():
+                if pending_errors:
+                    self.error_found.emit("\n".join(pending_errors))
+                    pending_errors.clear()
 
             def check_callback(ctx, message):
+                # Error langsung dikirim ke GUI (dikumpulkan per EMIT_INTERVAL),
+                # bukan disimpan semua sampai pemeriksaan selesai. Walau record
+                # diperiksa paralel, check_integrity memanggil callback ini
+                # berurutan di thread worker, jadi tidak perlu lock.
+                nonlocal error_count, last_emit
+                error_count += 1
                 if isinstance(ctx, Record):
-                    errors.append(f"ERROR for {ctx.filename}: {message}")
+                    pending_errors.append(f"ERROR for {ctx.filename}: {message}")
                 else:
-                    errors.append(f"GENERAL ERROR: {message}")
-
-            with open(self.pak_file, "rb") as stream:
-                self.pak_obj.check_integrity(stream, check_callback, ignore_nulls)
+                    pending_errors.append(f"GENERAL ERROR: {message}")
+                now = time.monotonic()
+                if now - last_emit >= self.EMIT_INTERVAL:
+                    last_emit = now
+                    flush_errors()
+
+            def check_progress(checked_size, total_size):
+                # Dalam MiB agar tetap muat di int QProgressBar
+                self.progress.emit(checked_size >> 20, max(total_size >> 20, 1))
+
+            with open(pak_file, "rb", buffering=STREAM_BUFFER_SIZE) as stream:
+                # Indeks yang sudah dimuat di tab Info & Unpack dipakai lagi bila
+                # file-nya sama dan tidak berubah sejak dimuat (mis. ditimpa
+                # dari tab Pack), selain itu dibaca di sini tanpa menggantinya
+                if (self.pak_obj is not None and self.pak_file and
+                        os.path.abspath(pak_file) == os.path.abspath(self.pak_file) and
+                        self._file_identity(os.fstat(stream.fileno())) == self.pak_stat):
+                    pak_obj = self.pak_obj
+                else:
+                    pak_obj = read_index(stream)
+                pak_obj.check_integrity(stream, check_callback, ignore_nulls, check_progress)
+            flush_errors()
             
-            if not errors:
+            if not error_count:
                 self.log.emit("Integrity test finished. All ok.")
             else:
-                self.log.emit(f"Integrity test finished. Found {len(errors)} error(s).")
+                self.log.emit(f"Integrity test finished. Found {error_count} error(s).")
             
-            self.test_results.emit(errors)
+            self.test_results.emit(error_count)
 
         except Exception as e:
+            flush_errors()
             self.error.emit(f"Integrity test failed:\n{traceback.format_exc()}")
         finally:
             self.finished.emit()
 
 class U4PakGUI(QMainWindow):
+    # Permintaan tugas untuk worker. Method worker yang dipanggil langsung
+    # berjalan di thread GUI; lewat sinyal ini (QueuedConnection karena
+    # worker ada di thread lain) slot-nya berjalan di thread worker.
+    load_requested = Signal(str)
+    info_requested = Signal(bool)
+    unpack_requested = Signal(str, object, bool)
+    pack_requested = Signal(object, str, str, int, bool)
+    test_requested = Signal(str, bool)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Unreal Engine 4 .pak Tool")
@@ -1894,8 +3187,15 @@ class U4PakGUI(QMainWindow):
         self.worker.pak_loaded.connect(self.on_pak_loaded)
         self.worker.info_ready.connect(self.display_info)
         self.worker.test_results.connect(self.display_test_results)
+        self.worker.error_found.connect(self.display_test_errors)
         self.worker.finished.connect(self.on_task_finished)
 
+        self.load_requested.connect(self.worker.load_pak)
+        self.info_requested.connect(self.worker.get_info)
+        self.unpack_requested.connect(self.worker.unpack_files)
+        self.pack_requested.connect(self.worker.pack_files)
+        self.test_requested.connect(self.worker.test_integrity)
+
     def create_unpack_tab(self):
         """Membuat UI untuk tab 'Info & Unpack'."""
         tab_widget = QWidget()
@@ -1925,13 +3225,13 @@ class U4PakGUI(QMainWindow):
 
         # --- Tampilan Tree untuk Konten ---
         self.file_tree = QTreeView()
-        self.file_tree_model = QStandardItemModel()
-        self.file_tree_model.setHorizontalHeaderLabels(['Filename', 'Size', 'Compressed Size', 'Compression', 'SHA1'])
+        self.file_tree_model = PakTreeModel(self)
         self.file_tree.setModel(self.file_tree_model)
         self.file_tree.setSortingEnabled(True)
         self.file_tree.header().setSectionResizeMode(QHeaderView.ResizeToContents)
         self.file_tree.header().setStretchLastSection(False)
         self.file_tree.setSelectionMode(QTreeView.ExtendedSelection)
+        self.file_tree.setEditTriggers(QTreeView.NoEditTriggers)
         main_layout.addWidget(self.file_tree)
 
         # --- Bagian Unpack ---
@@ -1949,7 +3249,11 @@ class U4PakGUI(QMainWindow):
         self.unpack_selected_btn.clicked.connect(lambda: self.unpack_files(selected=True))
         self.unpack_all_btn.clicked.connect(lambda: self.unpack_files(selected=False))
         
+        # File tanpa kompresi yang isinya sudah sama (ukuran + SHA1) tidak ditulis ulang
+        self.skip_unpacked_check = QCheckBox("Skip files that are already unpacked")
+
         unpack_btn_layout = QHBoxLayout()
+        unpack_btn_layout.addWidget(self.skip_unpacked_check)
         unpack_btn_layout.addStretch()
         unpack_btn_layout.addWidget(self.unpack_selected_btn)
         unpack_btn_layout.addWidget(self.unpack_all_btn)
@@ -2074,9 +3378,12 @@ class U4PakGUI(QMainWindow):
         self.test_results_area = QTextEdit()
         self.test_results_area.setReadOnly(True)
         
+        self.progress_bar_test = QProgressBar()
+
         main_layout.addStretch()
         main_layout.addWidget(QLabel("Log & Results:"))
         main_layout.addWidget(self.test_results_area)
+        main_layout.addWidget(self.progress_bar_test)
 
         self.tabs.addTab(tab_widget, "Test")
 
@@ -2150,6 +3457,8 @@ class U4PakGUI(QMainWindow):
             progress_bar = self.progress_bar_unpack
         elif current_tab_index == 1:
             progress_bar = self.progress_bar_pack
+        elif current_tab_index == 2:
+            progress_bar = self.progress_bar_test
         
         if progress_bar:
             progress_bar.setMaximum(total)
@@ -2158,43 +3467,9 @@ class U4PakGUI(QMainWindow):
     def on_pak_loaded(self, pak_obj):
         """Mengisi tree view setelah .pak dimuat."""
         self.pak_obj = pak_obj
-        self.file_tree_model.clear()
-        self.file_tree_model.setHorizontalHeaderLabels(['Filename', 'Size', 'Compressed Size', 'Compression', 'SHA1'])
-
-        path_map = {}
-        root_item = self.file_tree_model.invisibleRootItem()
-
-        for record in sorted(self.pak_obj.records, key=lambda r: r.filename):
-            path_components = record.filename.split(os.path.sep)
-            current_parent = root_item
-            
-            # Membuat path folder
-            for i in range(len(path_components) - 1):
-                dir_path = os.path.sep.join(path_components[:i+1])
-                if dir_path not in path_map:
-                    dir_item = QStandardItem(path_components[i])
-                    dir_item.setEditable(False)
-                    current_parent.appendRow(dir_item)
-                    path_map[dir_path] = dir_item
-                    current_parent = dir_item
-                else:
-                    current_parent = path_map[dir_path]
-
-            # Menambahkan item file
-            name_item = QStandardItem(path_components[-1])
-            name_item.setEditable(False)
-            name_item.setData(record.filename, Qt.UserRole) # Simpan path lengkap
-
-            size_item = QStandardItem(human_size(record.uncompressed_size))
-            csize_item = QStandardItem(human_size(record.compressed_size))
-            comp_item = QStandardItem(COMPR_METHOD_NAMES.get(record.compression_method, 'unknown'))
-            sha1_item = QStandardItem(hexlify(record.sha1).decode('latin1'))
+        # Model membaca kolom-kolom (SoA) PakIndex langsung, tanpa item per baris
+        self.file_tree_model.set_index(self.pak_obj.index())
 
-            for item in [size_item, csize_item, comp_item, sha1_item]:
-                item.setEditable(False)
-
-            current_parent.appendRow([name_item, size_item, csize_item, comp_item, sha1_item])
-        
         self.file_tree.header().setSectionResizeMode(0, QHeaderView.Stretch)
         # Aktifkan tombol yang relevan
         self.info_btn.setEnabled(True)
@@ -2212,9 +3487,9 @@ class U4PakGUI(QMainWindow):
         self.file_tree_model.clear()
         self.set_ui_busy(True)
         
-        # Jalankan di thread
+        # Jalankan di thread worker
         self.worker.pak_file = pak_file
-        self.worker.load_pak(pak_file)
+        self.load_requested.emit(pak_file)
 
     def get_archive_info(self):
         if not self.pak_obj:
@@ -2222,7 +3497,7 @@ class U4PakGUI(QMainWindow):
             return
         
         self.set_ui_busy(True)
-        self.worker.get_info(human_readable=True)
+        self.info_requested.emit(True)
         
     def display_info(self, info_text):
         info_dialog = QMessageBox(self)
@@ -2250,7 +3525,7 @@ class U4PakGUI(QMainWindow):
             selected_files = [idx.data(Qt.UserRole) for idx in indexes if idx.data(Qt.UserRole)]
         
         self.set_ui_busy(True)
-        self.worker.unpack_files(out_dir, selected_files)
+        self.unpack_requested.emit(out_dir, selected_files, self.skip_unpacked_check.isChecked())
         
     def start_packing(self):
         output_file = self.pack_output_edit.text()
@@ -2269,7 +3544,7 @@ class U4PakGUI(QMainWindow):
         
         self.log_area_pack.clear()
         self.set_ui_busy(True)
-        self.worker.pack_files(items_to_pack, output_file, mount_point, version, use_zlib)
+        self.pack_requested.emit(items_to_pack, output_file, mount_point, version, use_zlib)
         
     def run_integrity_test(self):
         pak_file = self.test_pak_path_edit.text()
@@ -2279,26 +3554,19 @@ class U4PakGUI(QMainWindow):
             
         self.test_results_area.clear()
         self.set_ui_busy(True)
-        
-        # Memuat pak terlebih dahulu, lalu menjalankan tes
-        # Ini bisa dioptimalkan dengan membuat fungsi worker tunggal
-        try:
-            with open(pak_file, "rb") as stream:
-                pak_for_test = read_index(stream)
-                self.worker.pak_obj = pak_for_test
-                self.worker.pak_file = pak_file
-                self.worker.test_integrity(self.test_ignore_nulls_check.isChecked())
-        except Exception as e:
-            self.show_error_message(f"Failed to load .pak for testing:\n{e}")
-            self.set_ui_busy(False)
+
+        # Worker membaca indeksnya sendiri (di thread worker) kecuali .pak ini
+        # sudah dimuat di tab Info & Unpack
+        self.test_requested.emit(pak_file, self.test_ignore_nulls_check.isChecked())
             
-    def display_test_results(self, errors):
-        if not errors:
+    def display_test_errors(self, errors):
+        self.test_results_area.append(errors)
+
+    def display_test_results(self, error_count):
+        if not error_count:
             self.test_results_area.append("\n--- RESULT: All OK ---")
         else:
-            self.test_results_area.append("\n--- RESULT: Found errors! ---")
-            for error in errors:
-                self.test_results_area.append(error)
+            self.test_results_area.append(f"\n--- RESULT: Found {error_count} error(s)! ---")
 
     def closeEvent(self, event):
         """Memastikan thread worker berhenti saat aplikasi ditutup."""